@@ -0,0 +1,99 @@
+import random
+from datetime import date, datetime, timedelta
+
+import function_db as db
+
+SURNAMES = "陳李張黃何林吳劉蔡楊鄭梁謝郭曾羅馮鄧許蕭"
+GIVEN = "嘉俊浩文子晴詠欣思穎家明偉志雅婷卓軒樂怡凱琳智海"
+SCHOOLS = ["聖公會馬鞍山主風小學", "沙田官立中學", "東涌天主教學校", "香港島中學", "聖公會林裘謀中學"]
+REGIONS = ["Tung Chung", "Hong Kong Island"]
+DISTRICTS = ["馬鞍山", "沙田", "東涌", "中環", "灣仔", "觀塘", "荃灣"]
+ACTIVITY_WORDS = ["青少年", "義工", "領袖", "體驗", "工作坊", "探索", "生涯規劃", "藝術", "運動", "交流團", "訓練營"]
+NATURES = ["義工服務", "歷奇活動", "生涯規劃", "文化藝術", "體育"]
+ORGANIZERS = ["香港聖公會福利協會", "民政事務總署", "青年發展委員會", "賽馬會青年幹線"]
+
+
+def _name(rng):
+    return rng.choice(SURNAMES) + "".join(rng.choices(GIVEN, k=rng.choice([1, 2])))
+
+
+def make_activity(rng, index, start=None, sessions=None):
+    """One activity in the shape returned by the striveandrise API."""
+    start = start or date.today() + timedelta(days=rng.randint(-365, 365))
+    session_count = sessions or rng.choice([1, 1, 1, 2, 3])
+    session_list = []
+    for n in range(session_count):
+        day = start + timedelta(days=7 * n)
+        hour = rng.randint(9, 18)
+        session_list.append({'startDate': day.isoformat(), 'startTime': f"{hour:02d}:00",
+                             'endDate': day.isoformat(), 'endTime': f"{hour + 2:02d}:00"})
+    district = rng.choice(DISTRICTS)
+    title = f"{district}{''.join(rng.sample(ACTIVITY_WORDS, 2))}{index}"
+    return {
+        'activityCode': f"ACT{index:06d}",
+        'subActivityCode': "",
+        'name_tc': title,
+        'name_en': f"Activity {index}",
+        'description_tc': f"{title}：" + "，".join(rng.sample(ACTIVITY_WORDS, 4)) + "。",
+        'sessions': session_list,
+        'locationAddress_tc': f"{district}{rng.randint(1, 200)}號{rng.choice(['社區中心', '青年空間', '活動室'])}",
+        'locationLatLng': {'lat': 22.2 + rng.random() * 0.3, 'lng': 113.9 + rng.random() * 0.4},
+        'quota': rng.choice([10, 20, 30, 40, 60]),
+        'supportingOrganiserName_tc': rng.choice(ORGANIZERS),
+        'activityNature': {'name_tc': rng.choice(NATURES)},
+        'thumbnailUrl_tc': "",
+    }
+
+
+def make_student_csv(rows, seed=7, invalid_ratio=0.01):
+    """CSV bytes in the student import format, with a few invalid and duplicate rows."""
+    import csv
+    import io
+    rng = random.Random(seed)
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['姓名', '聯絡方式', '地址', '英文名', '地區', '學校', '備註'])
+    previous = None
+    for i in range(rows):
+        row = [_name(rng), f"9{rng.randint(0, 9999999):07d}", f"{rng.choice(DISTRICTS)}{rng.randint(1, 50)}座",
+               f"Imported {i}", rng.choice(REGIONS), rng.choice(SCHOOLS), ""]
+        roll = rng.random()
+        if roll < invalid_ratio:
+            row[1] = "12345"
+        elif roll < 2 * invalid_ratio and previous:
+            row = previous
+        writer.writerow(row)
+        previous = row
+    return out.getvalue().encode('utf-8')
+
+
+def generate_database(events=1000, students=2000, attendance=20000, seed=42):
+    """Fill the current function_db.DB_NAME with synthetic data; returns the row counts."""
+    import function_sync as sync
+    rng = random.Random(seed)
+    db.init_db()
+    now = datetime.now()
+    columns = sync.EVENT_COLUMNS
+    event_rows = [sync.event_to_row(make_activity(rng, i)) for i in range(events)]
+    with db.get_connection() as conn:
+        conn.executemany(f'''INSERT INTO events ({', '.join(columns)}, created_at)
+                             VALUES ({','.join(['?'] * (len(columns) + 1))})''',
+                         [[row[c] for c in columns] + [now] for row in event_rows])
+        ids = dict(conn.execute('SELECT external_id, id FROM events'))
+        for row in event_rows:
+            db.replace_event_sessions(conn, ids[row['external_id']], db.event_session_datetimes(row['sessions']))
+        conn.executemany('''INSERT INTO students (name, contact, address, english_name, region, school, remarks, registered_at)
+                            VALUES (?,?,?,?,?,?,?,?)''',
+                         [(_name(rng), f"9{rng.randint(0, 9999999):07d}", f"{rng.choice(DISTRICTS)}{rng.randint(1, 50)}座",
+                           f"Student {i}", rng.choice(REGIONS), rng.choice(SCHOOLS), "", now)
+                          for i in range(students)])
+        event_ids = [r[0] for r in conn.execute('SELECT id FROM events')]
+        student_ids = [r[0] for r in conn.execute('SELECT id FROM students')]
+        pairs = set()
+        target = min(attendance, len(event_ids) * len(student_ids))
+        while len(pairs) < target:
+            pairs.add((rng.choice(event_ids), rng.choice(student_ids)))
+        conn.executemany('''INSERT INTO attendance (event_id, student_id, attended, updated_at) VALUES (?,?,?,?)''',
+                         [(e, s, rng.random() < 0.7, now) for e, s in pairs])
+    db.invalidate()
+    return {'events': events, 'students': students, 'attendance': target}
@@ -0,0 +1,307 @@
+"""Benchmark and load-test suite for the data layer and the page scripts.
+
+Run from the repository root, e.g.::
+
+    python -m benchmarks.run --events 5000 --students 20000 --attendance 200000 --output bench.json
+    python -m benchmarks.run --baseline bench.json --threshold 1.25
+
+Every benchmark runs against a fresh synthetic database in a temp directory.
+Results are written as JSON; with ``--baseline`` the run exits non-zero when
+any median is slower than the baseline by more than ``--threshold``.
+"""
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date, datetime
+
+import function_cache
+import function_db as db
+from benchmarks.data import generate_database, make_student_csv
+
+SUITES = ['db', 'concurrency', 'attendance', 'export', 'import', 'sync', 'pages']
+PAGES = ['page_home.py', 'page_event.py', 'page_students.py', 'page_event_details.py', 'page_student_details.py',
+         'page_event_map.py']
+
+
+def measure(fn, repeat=20, setup=None):
+    samples = []
+    for _ in range(repeat):
+        if setup:
+            setup()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    samples.sort()
+    median = statistics.median(samples)
+    return {'n': repeat, 'median': median, 'p95': samples[min(len(samples) - 1, int(len(samples) * 0.95))],
+            'min': samples[0], 'ops_per_sec': 1 / median if median else None}
+
+
+def _cold():
+    function_cache.invalidate()
+
+
+def bench_db(results, repeat):
+    event_id = db.query_events(columns=['id'], limit=1)[0]['id']
+    student_id = db.query_students(columns=['id'], limit=1)[0]['id']
+    reads = {
+        'get_events': db.get_events,
+        'get_students': db.get_students,
+        'get_event': lambda: db.get_event(event_id),
+        'get_student': lambda: db.get_student(student_id),
+        'query_events_page': lambda: db.query_events(columns=['id', 'name_tc', 'start_date'], order_by='start_date',
+                                                     descending=True, limit=20, offset=100),
+        'query_events_upcoming': lambda: db.query_events(start_date_from=date.today(), limit=5),
+        'count_events': db.count_events,
+        'count_students': db.count_students,
+        'search_events': lambda: db.search_events('青少年', limit=20),
+        'search_students': lambda: db.search_students('陳', limit=20),
+        'get_current_registrations': lambda: db.get_current_registrations(event_id),
+        'get_attendance_records': lambda: db.get_attendance_records(event_id),
+        'get_student_attendance': lambda: db.get_student_attendance(student_id),
+        'get_student_stats': lambda: db.get_student_stats(student_id),
+        'get_event_stats': lambda: db.get_event_stats(event_id),
+        'get_overview_stats': db.get_overview_stats,
+        'get_monthly_stats': db.get_monthly_stats,
+        'get_event_sessions': lambda: db.get_event_sessions(event_id),
+        'get_upcoming_sessions': db.get_upcoming_sessions,
+        'query_events_bbox': lambda: db.query_events(columns=['id', 'name_tc', 'location_lat', 'location_lng'],
+                                                     bbox=(22.3, 114.1, 22.4, 114.2), start_date_from=date.today()),
+        'nearest_events': lambda: db.nearest_events(*db.CENTRE_LOCATION, k=10),
+    }
+    for name, fn in reads.items():
+        results[f"db.{name}.uncached"] = measure(fn, repeat, setup=_cold)
+        fn()
+        results[f"db.{name}.cached"] = measure(fn, repeat)
+
+    student = {'name': '陳大文', 'contact': '91234567', 'address': '馬鞍山', 'english_name': 'Chan Tai Man',
+               'region': 'Tung Chung', 'school': '沙田官立中學', 'remarks': ''}
+    results['db.save_student.insert'] = measure(lambda: db.save_student(dict(student)), repeat)
+    event = dict(db.get_event(event_id))
+    del event['version']  # unconditional update; the stress test covers compare-and-swap
+    results['db.save_event.update'] = measure(lambda: db.save_event(dict(event)), repeat)
+    registered = db.get_current_registrations(event_id)
+    results['db.save_registration_changes'] = measure(lambda: db.save_registration_changes(event_id, registered), repeat)
+    results['db.find_full_scans'] = measure(db.find_full_scans, max(3, repeat // 4))
+
+
+def bench_concurrency(results, threads, ops):
+    event_ids = [r['id'] for r in db.query_events(columns=['id'], limit=50)]
+
+    def pooled(i):
+        event_id = event_ids[i % len(event_ids)]
+        with db.get_connection() as conn:
+            conn.execute('SELECT student_id FROM attendance WHERE event_id = ?', (event_id,)).fetchall()
+        with db.get_connection() as conn:
+            conn.execute('UPDATE attendance SET updated_at = ? WHERE event_id = ?', (datetime.now(), event_id))
+
+    def per_call(i):
+        # The original access pattern: a fresh connection per call, no pragmas or pooling.
+        event_id = event_ids[i % len(event_ids)]
+        conn = sqlite3.connect(db.DB_NAME, timeout=30)
+        conn.execute('SELECT student_id FROM attendance WHERE event_id = ?', (event_id,)).fetchall()
+        conn.close()
+        conn = sqlite3.connect(db.DB_NAME, timeout=30)
+        conn.execute('UPDATE attendance SET updated_at = ? WHERE event_id = ?', (datetime.now(), event_id))
+        conn.commit()
+        conn.close()
+
+    for name, op in (('per_call_connect', per_call), ('pooled', pooled)):
+        def session(op=op):
+            for i in range(ops):
+                op(i)
+        workers = [threading.Thread(target=session) for _ in range(threads)]
+        started = time.perf_counter()
+        for w in workers:
+            w.start()
+        for w in workers:
+            w.join()
+        elapsed = time.perf_counter() - started
+        results[f"concurrency.{name}.{threads}_sessions"] = {
+            'n': threads * ops, 'median': elapsed / (threads * ops), 'ops_per_sec': threads * ops / elapsed}
+
+
+def bench_attendance(results, sizes):
+    with db.get_connection() as conn:
+        student_ids = [r[0] for r in conn.execute('SELECT id FROM students')]
+    for size in sizes:
+        if size > len(student_ids):
+            with db.get_connection() as conn:
+                conn.executemany('INSERT INTO students (name, registered_at) VALUES (?, ?)',
+                                 [(f"學生{i}", datetime.now()) for i in range(size - len(student_ids))])
+                student_ids = [r[0] for r in conn.execute('SELECT id FROM students')]
+        db.save_event({'name_tc': f"出席基準 {size}", 'name_en': '', 'description_tc': '', 'start_date': str(date.today()),
+                       'end_date': str(date.today()), 'location_address_tc': '', 'quota': size, 'organizer_tc': '',
+                       'activity_nature_tc': '', 'sessions': '[]', 'thumbnail_url': ''})
+        event_id = db.query_events(columns=['id'], order_by='id', descending=True, limit=1)[0]['id']
+        db.save_registration_changes(event_id, student_ids[:size])
+        state = {}
+
+        def toggle(flip=True):
+            state['original'] = db.get_attendance_records(event_id)
+            state['edited'] = state['original'].copy()
+            if flip:
+                state['edited']['attended'] = ~state['edited']['attended'].astype(bool)
+
+        def update():
+            db.update_attendance_records(state['edited'], event_id, state['original'])
+
+        results[f"attendance.update.{size}_rows"] = measure(update, 3, setup=toggle)
+        results[f"attendance.update_unchanged.{size}_rows"] = measure(update, 3, setup=lambda: toggle(False))
+
+        def row_by_row():
+            # The original implementation, for comparison.
+            with db.get_connection() as conn:
+                for _, row in state['edited'].iterrows():
+                    conn.execute('UPDATE attendance SET attended = ?, updated_at = ? WHERE event_id = ? AND student_id = ?',
+                                 (bool(row['attended']), datetime.now(), event_id, int(row['student_id'])))
+        results[f"attendance.row_by_row.{size}_rows"] = measure(row_by_row, 1, setup=toggle)
+
+
+def bench_export(results):
+    import function_export as export
+    for fmt in export.FORMATS:
+        with tempfile.TemporaryFile() as out:
+            stats = export.export_data(fmt, out)
+        results[f"export.{fmt}"] = {'n': 1, 'median': stats['elapsed'], 'rows': stats['rows'],
+                                    'rows_per_sec': stats['rows_per_sec']}
+
+
+def bench_import(results, rows):
+    import io
+    import function_import as importer
+    from benchmarks.data import SCHOOLS
+    data = make_student_csv(rows)
+    started = time.perf_counter()
+    df = importer.read_students(io.BytesIO(data), 'students.csv')
+    results[f"import.read_csv.{rows}_rows"] = {'n': 1, 'median': time.perf_counter() - started}
+    results[f"import.validate.{rows}_rows"] = measure(lambda: importer.validate_students(df), 3)
+    stats = importer.import_students(df)
+    results[f"import.import_students.{rows}_rows"] = {'n': 1, 'median': stats['elapsed'], 'inserted': stats['inserted'],
+                                                      'errors': len(stats['errors'])}
+
+    db.save_event({'name_tc': "批量註冊基準", 'name_en': '', 'description_tc': '', 'start_date': str(date.today()),
+                   'end_date': str(date.today()), 'location_address_tc': '', 'quota': rows, 'organizer_tc': '',
+                   'activity_nature_tc': '', 'sessions': '[]', 'thumbnail_url': ''})
+    event_id = db.query_events(columns=['id'], order_by='id', descending=True, limit=1)[0]['id']
+    started = time.perf_counter()
+    added = db.register_cohort(event_id, school=SCHOOLS[0])
+    results['import.register_cohort'] = {'n': 1, 'median': time.perf_counter() - started, 'registered': added}
+
+
+def bench_sync(results, activities, delay):
+    import function_sync as sync
+    from benchmarks.stub_api import StubActivityAPI
+    with StubActivityAPI({'SKHWC': activities, 'EXTRA': activities // 4}, delay=delay) as api:
+        kwargs = {'force': True, 'base_url': api.base_url, 'target_groups': ['SKHWC', 'EXTRA'], 'hits': 200}
+        for name in ('initial', 'not_modified'):
+            stats = sync.sync_external_events(**kwargs)
+            results[f"sync.{name}"] = {'n': 1, 'median': stats['elapsed'], **{k: stats[k] for k in
+                                       ('fetched', 'inserted', 'updated', 'skipped', 'requests')}}
+
+
+def bench_pages(results, repeat):
+    from streamlit.testing.v1 import AppTest
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    event_id = db.query_events(columns=['id'], limit=1)[0]['id']
+    student_id = db.query_students(columns=['id'], limit=1)[0]['id']
+    for page in PAGES:
+        def render(page=page):
+            at = AppTest.from_file(os.path.join(root, page), default_timeout=120)
+            at.session_state['selected_event'] = event_id
+            at.session_state['selected_student'] = student_id
+            at.run()
+            if at.exception:
+                raise RuntimeError(f"{page}: {at.exception[0].message}")
+        results[f"pages.{page}.uncached"] = measure(render, repeat, setup=_cold)
+        results[f"pages.{page}.cached"] = measure(render, repeat)
+
+
+def compare(results, baseline, threshold):
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get('results', {}).get(name)
+        if previous and previous.get('median') and current.get('median'):
+            ratio = current['median'] / previous['median']
+            if ratio > threshold:
+                regressions.append((name, previous['median'], current['median'], ratio))
+    return regressions
+
+
+def _git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True).stdout.strip()
+    except OSError:
+        return None
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--suites', nargs='+', default=SUITES, choices=SUITES)
+    parser.add_argument('--events', type=int, default=2000)
+    parser.add_argument('--students', type=int, default=5000)
+    parser.add_argument('--attendance', type=int, default=50000)
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--threads', type=int, default=8, help="concurrent simulated sessions")
+    parser.add_argument('--ops', type=int, default=200, help="operations per simulated session")
+    parser.add_argument('--attendance-sizes', type=int, nargs='+', default=[1000, 10000, 100000])
+    parser.add_argument('--import-rows', type=int, default=50000, help="students in the bulk import file")
+    parser.add_argument('--sync-activities', type=int, default=2000)
+    parser.add_argument('--sync-delay', type=float, default=0.05, help="stub API latency per request (s)")
+    parser.add_argument('--output', default='bench_output.json')
+    parser.add_argument('--baseline', help="earlier JSON output to compare against")
+    parser.add_argument('--threshold', type=float, default=1.25, help="allowed slowdown ratio vs the baseline")
+    args = parser.parse_args(argv)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        db.DB_NAME = os.path.join(workdir, 'bench.db')
+        db.use_database(None)  # the synthetic data is written straight to SQLite
+        started = time.perf_counter()
+        counts = generate_database(args.events, args.students, args.attendance)
+        results['setup.generate_database'] = {'n': 1, 'median': time.perf_counter() - started, **counts}
+        if 'db' in args.suites:
+            bench_db(results, args.repeat)
+        if 'concurrency' in args.suites:
+            bench_concurrency(results, args.threads, args.ops)
+        if 'export' in args.suites:
+            bench_export(results)
+        if 'import' in args.suites:
+            bench_import(results, args.import_rows)
+        if 'sync' in args.suites:
+            bench_sync(results, args.sync_activities, args.sync_delay)
+        if 'pages' in args.suites:
+            bench_pages(results, max(3, args.repeat // 4))
+        if 'attendance' in args.suites:
+            bench_attendance(results, args.attendance_sizes)
+        db.close_connections()
+
+    report = {'meta': {'commit': _git_commit(), 'timestamp': datetime.now().isoformat(),
+                       'python': platform.python_version(), 'sqlite': sqlite3.sqlite_version,
+                       'args': vars(args)},
+              'results': results}
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2, ensure_ascii=False)
+    for name, result in results.items():
+        print(f"{name:60s} {result['median'] * 1000:10.3f} ms")
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            regressions = compare(results, json.load(f), args.threshold)
+        for name, before, after, ratio in regressions:
+            print(f"REGRESSION {name}: {before * 1000:.3f} ms -> {after * 1000:.3f} ms ({ratio:.2f}x)")
+        if regressions:
+            return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
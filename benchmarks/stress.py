@@ -0,0 +1,105 @@
+"""Multi-threaded stress test for concurrent attendance and event editing.
+
+Run from the repository root, e.g.::
+
+    python -m benchmarks.stress --threads 16 --ops 300
+
+Each thread plays a staff member. It reads an event's attendance, flips a
+few students and saves with compare-and-swap; some threads also edit the
+event itself. Afterwards every row's version must equal the number of
+successful writes to it, and its flag must match that count. Otherwise an
+update was lost. The run exits non-zero on lost updates or on any
+"database is locked" error.
+"""
+import argparse
+import json
+import os
+import random
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+
+import function_db as db
+from benchmarks.data import generate_database
+
+
+def worker(event_id, ops, seed, totals, lock, event_every):
+    rng = random.Random(seed)
+    writes, stats = Counter(), Counter()
+    for i in range(ops):
+        stats['ops'] += 1
+        try:
+            if event_every and i % event_every == 0:
+                event = dict(db.get_event(event_id))
+                event['name_en'] = f"edited by {seed}"
+                try:
+                    db.save_event(event)
+                    stats['event_writes'] += 1
+                except db.ConflictError:
+                    stats['event_conflicts'] += 1
+                continue
+            original = db.get_attendance_records(event_id)
+            edited = original.copy()
+            rows = rng.sample(range(len(edited)), k=rng.randint(1, 5))
+            edited.loc[rows, 'attended'] = 1 - edited.loc[rows, 'attended']
+            result = db.update_attendance_records(edited, event_id, original)
+            conflicts = set(result['conflicts'])
+            for student_id in edited.loc[rows, 'student_id']:
+                if student_id not in conflicts:
+                    writes[int(student_id)] += 1
+            stats['attendance_writes'] += result['written']
+            stats['attendance_conflicts'] += len(conflicts)
+        except sqlite3.OperationalError as e:
+            stats['locked' if 'locked' in str(e) else 'operational_errors'] += 1
+    with lock:
+        totals['writes'].update(writes)
+        totals['stats'].update(stats)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--threads', type=int, default=8)
+    parser.add_argument('--ops', type=int, default=200, help="operations per thread")
+    parser.add_argument('--students', type=int, default=100, help="students registered to the contended event")
+    parser.add_argument('--event-every', type=int, default=10, help="every Nth operation edits the event (0 = never)")
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as workdir:
+        db.DB_NAME = os.path.join(workdir, 'stress.db')
+        db.use_database(None)  # the synthetic data is written straight to SQLite
+        generate_database(events=10, students=args.students, attendance=0)
+        event_id = db.query_events(columns=['id'], limit=1)[0]['id']
+        db.save_registration_changes(event_id, [s['id'] for s in db.query_students(columns=['id'])])
+        initial_event_version = db.get_event(event_id)['version']
+
+        totals, lock = {'writes': Counter(), 'stats': Counter()}, threading.Lock()
+        threads = [threading.Thread(target=worker, args=(event_id, args.ops, seed, totals, lock, args.event_every))
+                   for seed in range(args.threads)]
+        started = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        elapsed = time.perf_counter() - started
+
+        with db.get_connection() as conn:
+            final = {student_id: (attended, version) for student_id, attended, version in conn.execute(
+                'SELECT student_id, attended, version FROM attendance WHERE event_id = ?', (event_id,))}
+            event_version = conn.execute('SELECT version FROM events WHERE id = ?', (event_id,)).fetchone()[0]
+        db.close_connections()
+
+    stats = totals['stats']
+    lost = [student_id for student_id, (attended, version) in final.items()
+            if version != totals['writes'][student_id] or bool(attended) != bool(version % 2)]
+    lost_event_writes = event_version - initial_event_version != stats['event_writes']
+    report = {**stats, 'elapsed': elapsed, 'ops_per_sec': stats['ops'] / elapsed,
+              'lost_updates': len(lost), 'lost_event_updates': lost_event_writes}
+    print(json.dumps(report, indent=2))
+    return 1 if lost or lost_event_writes or stats['locked'] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
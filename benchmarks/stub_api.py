@@ -0,0 +1,102 @@
+import http.server
+import json
+import random
+import threading
+import time
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.data import make_activity
+
+
+class StubActivityAPI:
+    """Local stand-in for the striveandrise activities API.
+
+    Serves ``activities`` per target group, paginated by ``hits``/``page``,
+    honours If-None-Match and can add a fixed delay to every response;
+    ``peak_in_flight`` records how many requests were served at once. The
+    next ``fail_requests`` requests are answered with ``fail_status``;
+    ``feeds`` can be replaced to serve hand-made activities.
+    """
+
+    def __init__(self, activities_per_group=None, delay=0.0, include_total=True, etags=True, fail_requests=0,
+                 fail_status=500, seed=7):
+        rng = random.Random(seed)
+        # Activity codes run on across feeds, so every feed's activities are distinct.
+        self.feeds, offset = {}, 0
+        for group, count in (activities_per_group or {'SKHWC': 100}).items():
+            self.feeds[group] = [make_activity(rng, offset + i) for i in range(count)]
+            offset += count
+        self.delay = delay
+        self.include_total = include_total
+        self.etags = etags
+        self.fail_requests = fail_requests
+        self.fail_status = fail_status
+        self.requests = 0
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self._lock = threading.Lock()
+        self._server = None
+
+    def _handler(self):
+        api = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_GET(self):
+                with api._lock:
+                    api.requests += 1
+                    fail = api.fail_requests > 0
+                    api.fail_requests -= fail
+                    api.in_flight += 1
+                    api.peak_in_flight = max(api.peak_in_flight, api.in_flight)
+                try:
+                    self._respond(fail)
+                finally:
+                    with api._lock:
+                        api.in_flight -= 1
+
+            def _respond(self, fail):
+                query = parse_qs(urlparse(self.path).query)
+                feed = api.feeds.get(query.get('targetGroups', [''])[0], [])
+                hits = int(query.get('hits', ['1000'])[0])
+                page = int(query.get('page', ['1'])[0])
+                results = feed[(page - 1) * hits:page * hits]
+                etag = f'"{page}-{len(feed)}-{hash(json.dumps(results, sort_keys=True))}"'
+                if api.delay:
+                    time.sleep(api.delay)
+                if fail:
+                    self.send_response(api.fail_status)
+                    self.end_headers()
+                    return
+                if api.etags and self.headers.get('If-None-Match') == etag:
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                body = {'results': results}
+                if api.include_total:
+                    body['total'] = len(feed)
+                payload = json.dumps(body).encode('utf-8')
+                self.send_response(200)
+                self.send_header('Content-Type', 'application/json')
+                if api.etags:
+                    self.send_header('ETag', etag)
+                self.end_headers()
+                self.wfile.write(payload)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def __enter__(self):
+        self._server = http.server.ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self._server.handle_error = lambda request, client_address: None  # clients that time out and hang up
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc):
+        self._server.shutdown()
+        self._server.server_close()
+
+    @property
+    def base_url(self):
+        return f"http://127.0.0.1:{self._server.server_address[1]}/api/activities"
@@ -0,0 +1,50 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime
+
+import function_db as db
+import function_perf as perf
+import function_sync as sync
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+
+_lock = threading.Lock()
+_state = None
+
+
+@contextmanager
+def _file_lock(path):
+    # Serializes schema setup across worker processes sharing the database file.
+    with open(path, 'a') as f:
+        if fcntl is not None:
+            fcntl.flock(f, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def bootstrap():
+    """Set up the schema and start the background sync, once per process.
+
+    Returns when and how long the cold start took; later calls return the same
+    dict without doing any work.
+    """
+    global _state
+    with _lock:
+        if _state is None:
+            started = time.perf_counter()
+            with _file_lock(f"{os.path.abspath(db.DB_NAME)}.init.lock"):
+                db.init_db()
+            # The refresher's first run is the initial sync; it happens off the request path.
+            sync.get_refresher().start()
+            duration = time.perf_counter() - started
+            perf.record("應用.冷啟動", duration)
+            _state = {'started_at': datetime.now(), 'cold_start': duration}
+        return _state
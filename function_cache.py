@@ -0,0 +1,126 @@
+import functools
+import threading
+import time
+from collections import OrderedDict
+
+# Process-wide read cache shared by every Streamlit session. Entries are
+# tagged with the tables they were read from and dropped by invalidate()
+# when one of those tables is written.
+DEFAULT_TTL_SECONDS = 300
+DEFAULT_MAX_ENTRIES = 256
+
+_registry = []
+
+
+class LRUCache:
+    def __init__(self, maxsize=DEFAULT_MAX_ENTRIES, ttl=DEFAULT_TTL_SECONDS):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.generation = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return True, entry[1]
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return False, None
+
+    def put(self, key, value, generation):
+        with self._lock:
+            # Skip results read before an invalidation that happened meanwhile.
+            if generation != self.generation:
+                return
+            self._entries[key] = (time.monotonic() + self.ttl, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self.generation += 1
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions,
+                    'size': len(self._entries), 'maxsize': self.maxsize, 'ttl': self.ttl}
+
+
+def _freeze(value):
+    if isinstance(value, (list, tuple)):
+        return tuple(_freeze(v) for v in value)
+    if isinstance(value, dict):
+        return tuple(sorted((k, _freeze(v)) for k, v in value.items()))
+    if isinstance(value, set):
+        return frozenset(value)
+    return value
+
+
+class FrozenRecord(dict):
+    """A read-only dict. Copy it with ``dict(record)`` to get an editable one."""
+
+    def _read_only(self, *args, **kwargs):
+        raise TypeError("cached records are shared and read-only; copy with dict() first")
+
+    __setitem__ = __delitem__ = __ior__ = _read_only
+    clear = pop = popitem = setdefault = update = _read_only
+
+    def __reduce__(self):
+        return FrozenRecord, (dict(self),)
+
+
+def _immutable(value):
+    if isinstance(value, list):
+        return tuple(_immutable(v) for v in value)
+    if isinstance(value, dict) and not isinstance(value, FrozenRecord):
+        return FrozenRecord((k, _immutable(v)) for k, v in value.items())
+    return value
+
+
+def cached(*tags, ttl=DEFAULT_TTL_SECONDS, maxsize=DEFAULT_MAX_ENTRIES):
+    """Cache a read function's results, dropping them when any of ``tags`` is invalidated.
+
+    Every caller shares the one cached value: lists come back as tuples and
+    dicts as FrozenRecords. DataFrames are shared as-is, so callers that edit
+    a result in place must copy it first.
+    """
+    def decorator(func):
+        cache = LRUCache(maxsize=maxsize, ttl=ttl)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            key = (_freeze(args), _freeze(kwargs))
+            found, value = cache.get(key)
+            if not found:
+                generation = cache.generation
+                value = _immutable(func(*args, **kwargs))
+                cache.put(key, value, generation)
+            return value
+
+        wrapper.cache = cache
+        wrapper.uncached = func
+        wrapper.tags = frozenset(tags)
+        _registry.append(wrapper)
+        return wrapper
+    return decorator
+
+
+def invalidate(*tags):
+    for wrapper in _registry:
+        if not tags or wrapper.tags & set(tags):
+            wrapper.cache.clear()
+
+
+def stats():
+    return {f"{w.__module__}.{w.__name__}": w.cache.stats() for w in _registry}
@@ -0,0 +1,163 @@
+import csv
+import io
+import os
+import tempfile
+import time
+import zipfile
+
+import function_db as db
+
+# Rows fetched from the database per round trip, so the rows are never all
+# loaded at once (the written file itself is).
+CHUNK_SIZE = 5000
+
+FORMATS = {
+    'xlsx': ('community_data.xlsx', 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'),
+    'csv': ('community_data_csv.zip', 'application/zip'),
+    'parquet': ('community_data_parquet.zip', 'application/zip'),
+}
+SHEET_NAMES = {'events': 'Events', 'students': 'Students', 'attendance': 'Attendance'}
+
+
+def _event_filter(start_date_from=None, start_date_to=None, event_id=None):
+    where, params = [], []
+    if start_date_from is not None:
+        where.append("start_date >= ?")
+        params.append(str(start_date_from))
+    if start_date_to is not None:
+        where.append("start_date <= ?")
+        params.append(str(start_date_to))
+    if event_id is not None:
+        where.append("id = ?")
+        params.append(event_id)
+    return " AND ".join(where), params
+
+
+def export_queries(start_date_from=None, start_date_to=None, event_id=None):
+    """(table, sql, params) for every exported table under the given filters."""
+    where, params = _event_filter(start_date_from, start_date_to, event_id)
+    if not where:
+        return [(t, f"SELECT * FROM {t}", []) for t in SHEET_NAMES]
+    event_ids = f"SELECT id FROM events WHERE {where}"
+    return [
+        ('events', f"SELECT * FROM events WHERE {where}", params),
+        ('students', f'''SELECT * FROM students WHERE id IN
+                         (SELECT student_id FROM attendance WHERE event_id IN ({event_ids}))''', params),
+        ('attendance', f"SELECT * FROM attendance WHERE event_id IN ({event_ids})", params),
+    ]
+
+
+def _iter_tables(conn, queries, counts):
+    for table, sql, params in queries:
+        cursor = conn.execute(sql, params)
+        columns = [d[0] for d in cursor.description]
+        counts[table] = 0
+
+        def chunks(cursor=cursor, table=table):
+            while True:
+                rows = cursor.fetchmany(CHUNK_SIZE)
+                if not rows:
+                    break
+                counts[table] += len(rows)
+                yield rows
+
+        yield table, columns, chunks()
+
+
+def _write_xlsx(out, tables):
+    from openpyxl import Workbook
+    from openpyxl.cell.cell import ILLEGAL_CHARACTERS_RE
+    # write_only workbooks stream rows to disk instead of keeping cells in memory.
+    workbook = Workbook(write_only=True)
+    for table, columns, chunks in tables:
+        sheet = workbook.create_sheet(SHEET_NAMES[table])
+        sheet.append(columns)
+        for rows in chunks:
+            for row in rows:
+                sheet.append([ILLEGAL_CHARACTERS_RE.sub('', v) if isinstance(v, str) else v for v in row])
+    workbook.save(out)
+
+
+def _write_csv(out, tables):
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_DEFLATED) as archive:
+        for table, columns, chunks in tables:
+            with archive.open(f"{table}.csv", 'w', force_zip64=True) as raw, \
+                    io.TextIOWrapper(raw, encoding='utf-8-sig', newline='') as f:
+                writer = csv.writer(f)
+                writer.writerow(columns)
+                for rows in chunks:
+                    writer.writerows(rows)
+
+
+def _arrow_schema(table, columns):
+    import pyarrow as pa
+    declared = db.column_types(table)
+    fields = []
+    for column in columns:
+        decl = declared.get(column, '')
+        if decl == 'BOOLEAN':
+            fields.append(pa.field(column, pa.bool_()))
+        elif 'INT' in decl:
+            fields.append(pa.field(column, pa.int64()))
+        elif 'REAL' in decl:
+            fields.append(pa.field(column, pa.float64()))
+        else:
+            fields.append(pa.field(column, pa.string()))
+    return pa.schema(fields)
+
+
+def _write_parquet(out, tables):
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+    with zipfile.ZipFile(out, 'w', zipfile.ZIP_STORED) as archive:
+        for table, columns, chunks in tables:
+            schema = _arrow_schema(table, columns)
+            # SQLite returns text-typed values of any type and booleans as 0/1.
+            converters = {i: str if pa.types.is_string(f.type) else bool
+                          for i, f in enumerate(schema) if pa.types.is_string(f.type) or pa.types.is_boolean(f.type)}
+            with tempfile.NamedTemporaryFile(suffix='.parquet', delete=False) as tmp:
+                path = tmp.name
+            try:
+                with pq.ParquetWriter(path, schema) as writer:
+                    for rows in chunks:
+                        data = list(zip(*rows))
+                        arrays = [[None if v is None else converters[i](v) for v in data[i]] if i in converters
+                                  else data[i] for i in range(len(columns))]
+                        writer.write_batch(pa.record_batch(arrays, schema=schema))
+                archive.write(path, f"{table}.parquet")
+            finally:
+                os.remove(path)
+
+
+def export_data(fmt, out, start_date_from=None, start_date_to=None, event_id=None):
+    """Stream the events, students and attendance tables into ``out``.
+
+    ``out`` is a path or a writable binary file. Returns row counts per table,
+    the total, the elapsed time and rows/sec.
+    """
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format: {fmt}")
+    started = time.perf_counter()
+    counts = {}
+    queries = export_queries(start_date_from, start_date_to, event_id)
+    with db.read_connection() as conn:
+        tables = _iter_tables(conn, queries, counts)
+        if fmt == 'xlsx':
+            _write_xlsx(out, tables)
+        elif fmt == 'csv':
+            _write_csv(out, tables)
+        else:
+            _write_parquet(out, tables)
+    elapsed = time.perf_counter() - started
+    rows = sum(counts.values())
+    return {'tables': counts, 'rows': rows, 'elapsed': elapsed,
+            'rows_per_sec': rows / elapsed if elapsed else 0.0}
+
+
+def export_bytes(fmt, stats=None, **filters):
+    """The exported file as bytes, e.g. for st.download_button."""
+    out = io.BytesIO()
+    result = export_data(fmt, out, **filters)
+    if stats is not None:
+        stats.update(result)
+    return out.getvalue()
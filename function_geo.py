@@ -0,0 +1,47 @@
+import function_db as db
+import function_perf as perf
+
+# Hong Kong government Address Lookup Service; results are kept in the geocodes table.
+GEOCODER_URL = "https://www.als.gov.hk/lookup"
+GEOCODER_TIMEOUT = 10
+
+
+def _parse_als(payload):
+    for suggestion in payload.get('SuggestedAddress', []):
+        info = suggestion.get('Address', {}).get('PremisesAddress', {}).get('GeospatialInformation')
+        if isinstance(info, list):
+            info = info[0] if info else None
+        if info and info.get('Latitude') and info.get('Longitude'):
+            return float(info['Latitude']), float(info['Longitude'])
+    return None
+
+
+def geocode(address, timeout=GEOCODER_TIMEOUT):
+    """(lat, lng) for a Hong Kong address, or None when it cannot be located.
+
+    Looked-up addresses are cached in the database, including misses; network
+    errors are not cached so the lookup is retried next time.
+    """
+    address = (address or '').strip()
+    if not address:
+        return None
+    cached = db.get_geocode(address)
+    if cached is not None:
+        return None if cached[0] is None else tuple(cached)
+    import requests
+    with perf.timed("地理編碼.查詢", address=address):
+        response = requests.get(GEOCODER_URL, params={'q': address, 'n': 1},
+                                headers={'Accept': 'application/json'}, timeout=timeout)
+        response.raise_for_status()
+    location = _parse_als(response.json())
+    db.save_geocode(address, *(location or (None, None)))
+    return location
+
+
+def nearest_events_to_student(student_id, k=10, **filters):
+    """Events nearest to a student's address; None when the address cannot be geocoded."""
+    student = db.get_student(student_id)
+    location = geocode(student['address']) if student else None
+    if location is None:
+        return None
+    return db.nearest_events(*location, k=k, **filters)
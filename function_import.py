@@ -0,0 +1,82 @@
+import os
+import time
+
+import function_db as db
+
+IMPORT_FORMATS = ['csv', 'xlsx']
+STUDENT_COLUMNS = db.STUDENT_IMPORT_FIELDS
+# Headers accepted in uploaded files, besides the column names themselves.
+STUDENT_HEADERS = {
+    '姓名': 'name', '學生姓名': 'name',
+    '聯絡方式': 'contact', '電話': 'contact',
+    '地址': 'address',
+    '英文名': 'english_name',
+    '地區': 'region',
+    '學校': 'school',
+    '備註': 'remarks',
+}
+# Eight-digit Hong Kong numbers, optionally written with +852 and spaces or dashes.
+CONTACT_PATTERN = r'^(?:\+?852)?(\d{8})$'
+
+
+def read_students(file, filename):
+    """Read an uploaded CSV or Excel file into a DataFrame of strings."""
+    import pandas as pd
+    ext = os.path.splitext(filename)[1].lower().lstrip('.')
+    if ext == 'csv':
+        df = pd.read_csv(file, dtype=str, keep_default_na=False, encoding='utf-8-sig')
+    elif ext in ('xlsx', 'xlsm'):
+        df = pd.read_excel(file, dtype=str, keep_default_na=False)
+    else:
+        raise ValueError(f"Unsupported file type: {filename}")
+    df.columns = [STUDENT_HEADERS.get(str(c).strip(), str(c).strip().lower()) for c in df.columns]
+    return df
+
+
+def validate_students(df):
+    """Split imported rows into (valid, errors).
+
+    ``valid`` holds the cleaned student columns; ``errors`` has one row per
+    rejected input row with its line number in the file and the reasons.
+    Rows are checked as whole columns, not one by one.
+    """
+    import pandas as pd
+    if 'name' not in df.columns:
+        raise ValueError("Missing required column: name (姓名)")
+    df = df.reindex(columns=STUDENT_COLUMNS).fillna('').astype(str)
+    df = df.apply(lambda col: col.str.strip())
+    line = pd.Series(df.index + 2, index=df.index)  # 1-based, after the header row
+
+    contact = df['contact'].str.replace(r'[\s\-()]', '', regex=True)
+    df['contact'] = contact.str.extract(CONTACT_PATTERN, expand=False).fillna(contact)
+
+    reasons = pd.DataFrame(index=df.index)
+    reasons['缺少姓名'] = df['name'] == ''
+    reasons['電話號碼無效'] = (df['contact'] != '') & ~df['contact'].str.fullmatch(r'\d{8}')
+    reasons['地區無效'] = (df['region'] != '') & ~df['region'].isin(db.STUDENT_REGIONS)
+    reasons['文件內重複'] = df.duplicated(['name', 'contact'], keep='first')
+    existing = db.get_student_keys().fillna('')
+    keys = pd.MultiIndex.from_frame(df[['name', 'contact']])
+    reasons['已存在'] = keys.isin(pd.MultiIndex.from_frame(existing[['name', 'contact']].astype(str)))
+
+    bad = reasons.any(axis=1)
+    errors = pd.DataFrame({
+        '行': line[bad],
+        '姓名': df.loc[bad, 'name'],
+        '錯誤': reasons[bad].dot(reasons.columns + '、').str.rstrip('、'),
+    })
+    valid = df[~bad]
+    valid = valid.astype(object).where(valid != '', None)
+    return valid, errors
+
+
+def import_students(df):
+    """Validate and insert students in one transaction.
+
+    Returns a stats dict with the row count, how many were inserted, the
+    errors DataFrame from validate_students and the elapsed time.
+    """
+    started = time.perf_counter()
+    valid, errors = validate_students(df)
+    inserted = db.insert_students(valid.itertuples(index=False, name=None)) if len(valid) else 0
+    return {'rows': len(df), 'inserted': inserted, 'errors': errors, 'elapsed': time.perf_counter() - started}
@@ -0,0 +1,176 @@
+import contextvars
+import functools
+import json
+import math
+import os
+import random
+import threading
+import time
+from collections import defaultdict, deque
+from contextlib import contextmanager
+
+# Process-wide timings, keyed by name; only the most recent samples are kept.
+MAX_SAMPLES = 500
+MAX_RECENT_QUERIES = 200
+MAX_SQL_LENGTH = 500
+# Set PERF_TRACE_FILE to also append every span to a JSON Lines file.
+TRACE_FILE = os.environ.get('PERF_TRACE_FILE')
+
+_samples = defaultdict(lambda: deque(maxlen=MAX_SAMPLES))
+_queries = defaultdict(lambda: {'samples': deque(maxlen=MAX_SAMPLES), 'count': 0, 'rows': 0})
+_recent_queries = deque(maxlen=MAX_RECENT_QUERIES)
+_lock = threading.Lock()
+_file_lock = threading.Lock()
+_trace_handle = None
+_current_span = contextvars.ContextVar('perf_span', default=None)
+
+
+def record(name, duration):
+    with _lock:
+        _samples[name].append(duration)
+
+
+def _new_id(bits):
+    return f"{random.getrandbits(bits):0{bits // 4}x}"
+
+
+def current_span():
+    return _current_span.get()
+
+
+def _emit(span, end):
+    if not TRACE_FILE:
+        return
+    line = json.dumps({
+        'trace_id': span['trace_id'],
+        'span_id': span['span_id'],
+        'parent_span_id': span['parent_span_id'],
+        'name': span['name'],
+        'start_time_unix_nano': int(span['start'] * 1e9),
+        'end_time_unix_nano': int(end * 1e9),
+        'duration_ms': span['duration'] * 1000,
+        'status': span['status'],
+        'attributes': span['attributes'],
+        'thread': threading.current_thread().name,
+    }, ensure_ascii=False, default=str)
+    global _trace_handle
+    with _file_lock:
+        # One handle stays open; line buffering writes each span as it ends.
+        if _trace_handle is None or _trace_handle.name != TRACE_FILE:
+            if _trace_handle is not None:
+                _trace_handle.close()
+            _trace_handle = open(TRACE_FILE, 'a', encoding='utf-8', buffering=1)
+        _trace_handle.write(line + '\n')
+
+
+def _start_span(name, attributes, parent=None):
+    parent = parent or _current_span.get()
+    return {'name': name, 'duration': None, 'attributes': attributes, 'status': 'OK', 'start': time.time(),
+            'trace_id': parent['trace_id'] if parent else _new_id(128), 'span_id': _new_id(64),
+            'parent_span_id': parent['span_id'] if parent else None}
+
+
+@contextmanager
+def timed(name, **attributes):
+    """Record how long the ``with`` block takes under ``name``; yields the span, a dict holding the duration.
+
+    Spans opened inside the block (including SQL queries) become its children.
+    """
+    result = _start_span(name, attributes)
+    token = _current_span.set(result)
+    started = time.perf_counter()
+    try:
+        yield result
+    except BaseException as e:
+        result['status'] = 'ERROR'
+        result['attributes']['error'] = repr(e)
+        raise
+    finally:
+        result['duration'] = time.perf_counter() - started
+        _current_span.reset(token)
+        record(name, result['duration'])
+        _emit(result, result['start'] + result['duration'])
+
+
+def traced(name):
+    """Decorator form of timed()."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with timed(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def normalize_sql(sql):
+    sql = ' '.join(sql.split())
+    return sql if len(sql) <= MAX_SQL_LENGTH else sql[:MAX_SQL_LENGTH] + '…'
+
+
+def record_query(sql, duration, rows, parent=None, started_at=None):
+    """Record one SQL statement; ``rows`` is None when the row count is unknown."""
+    sql = normalize_sql(sql)
+    started_at = started_at or time.time() - duration
+    with _lock:
+        stats = _queries[sql]
+        stats['samples'].append(duration)
+        stats['count'] += 1
+        stats['rows'] += rows or 0
+        _recent_queries.append({'sql': sql, 'duration': duration, 'rows': rows, 'at': started_at,
+                                'caller': parent['name'] if parent else None})
+    if TRACE_FILE:
+        span = _start_span('sql', {'db.system': 'sqlite', 'db.statement': sql, 'db.rows': rows}, parent)
+        span.update(start=started_at, duration=duration)
+        _emit(span, started_at + duration)
+
+
+def last(name):
+    with _lock:
+        samples = _samples.get(name)
+        return samples[-1] if samples else None
+
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of an already sorted list."""
+    return ordered[max(0, math.ceil(q * len(ordered)) - 1)]
+
+
+def _distribution(samples):
+    ordered = sorted(samples)
+    return {'count': len(ordered), 'mean': sum(ordered) / len(ordered), 'p50': percentile(ordered, 0.50),
+            'p95': percentile(ordered, 0.95), 'p99': percentile(ordered, 0.99), 'max': ordered[-1]}
+
+
+def summary():
+    with _lock:
+        snapshot = {name: list(samples) for name, samples in _samples.items()}
+    return {name: {**_distribution(samples), 'last': samples[-1]}
+            for name, samples in snapshot.items() if samples}
+
+
+def query_summary():
+    """Per-statement timings; ``count``/``rows`` cover every call, the percentiles the recent ones."""
+    with _lock:
+        snapshot = {sql: (list(s['samples']), s['count'], s['rows']) for sql, s in _queries.items()}
+    return {sql: {**_distribution(samples), 'count': count, 'rows': rows}
+            for sql, (samples, count, rows) in snapshot.items() if samples}
+
+
+def recent_queries():
+    with _lock:
+        return list(_recent_queries)
+
+
+def reset():
+    with _lock:
+        _samples.clear()
+        _queries.clear()
+        _recent_queries.clear()
+
+
+def show_timing(result):
+    """Show a timed() result under the rendered block when render timings are enabled in the sidebar."""
+    import streamlit as st
+    if st.session_state.get('show_timings') and result['duration'] is not None:
+        st.caption(f"⏱ {result['name']}: {result['duration'] * 1000:.1f} ms")
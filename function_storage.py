@@ -0,0 +1,653 @@
+import json
+import time
+from contextlib import contextmanager
+from datetime import datetime, timedelta, timezone
+
+import sqlalchemy as sa
+from sqlalchemy.dialects import postgresql, sqlite
+
+import function_db as db
+import function_perf as perf
+
+# Server-database backend for the function_db repository functions, built on
+# SQLAlchemy Core so the same code runs on PostgreSQL and, for local testing,
+# SQLite. function_db.use_database() installs it when DATABASE_URL is set.
+POOL_SIZE = 8
+MAX_OVERFLOW = 8
+POOL_TIMEOUT_SECONDS = 30
+POOL_RECYCLE_SECONDS = 30 * 60
+SESSION_DATETIME_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+# Dialects with INSERT ... ON CONFLICT, which the upserts rely on.
+INSERTS = {'postgresql': postgresql.insert, 'sqlite': sqlite.insert}
+
+metadata = sa.MetaData()
+
+# Same tables and columns as the SQLite schema, minus what only SQLite has
+# (full-text and R*Tree indexes, generated start_at/end_at columns, the
+# trigger-maintained *_stats tables).
+events = sa.Table(
+    'events', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('external_id', sa.Text, unique=True),
+    sa.Column('name_tc', sa.Text),
+    sa.Column('name_en', sa.Text),
+    sa.Column('description_tc', sa.Text),
+    sa.Column('start_date', sa.Text, index=True),
+    sa.Column('end_date', sa.Text),
+    sa.Column('location_address_tc', sa.Text),
+    sa.Column('location_lat', sa.Float),
+    sa.Column('location_lng', sa.Float),
+    sa.Column('quota', sa.Integer),
+    sa.Column('organizer_tc', sa.Text),
+    sa.Column('activity_nature_tc', sa.Text),
+    sa.Column('sessions', sa.Text),
+    sa.Column('thumbnail_url', sa.Text),
+    sa.Column('created_at', sa.DateTime),
+    sa.Column('accurate_start_datetime', sa.Text),
+    sa.Column('accurate_end_datetime', sa.Text),
+    sa.Column('version', sa.Integer, nullable=False, server_default='0'),
+    sa.Index('idx_events_location', 'location_lat', 'location_lng'),
+)
+
+students = sa.Table(
+    'students', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('name', sa.Text),
+    sa.Column('contact', sa.Text),
+    sa.Column('address', sa.Text),
+    sa.Column('english_name', sa.Text),
+    sa.Column('region', sa.Text),
+    sa.Column('school', sa.Text, index=True),
+    sa.Column('remarks', sa.Text),
+    sa.Column('registered_at', sa.DateTime),
+    sa.Index('idx_students_region_school', 'region', 'school'),
+    sa.Index('idx_students_name', 'name', 'id'),
+)
+
+attendance = sa.Table(
+    'attendance', metadata,
+    sa.Column('event_id', sa.Integer, primary_key=True),
+    sa.Column('student_id', sa.Integer, primary_key=True),
+    sa.Column('attended', sa.Boolean),
+    sa.Column('updated_at', sa.DateTime),
+    sa.Column('version', sa.Integer, nullable=False, server_default='0'),
+    sa.Index('idx_attendance_student', 'student_id', 'event_id', 'attended'),
+)
+
+event_sessions = sa.Table(
+    'event_sessions', metadata,
+    sa.Column('id', sa.Integer, primary_key=True),
+    sa.Column('event_id', sa.Integer, nullable=False),
+    sa.Column('session_no', sa.Integer, nullable=False),
+    sa.Column('start_datetime', sa.Text, index=True),
+    sa.Column('end_datetime', sa.Text),
+    sa.UniqueConstraint('event_id', 'session_no'),
+)
+
+session_attendance = sa.Table(
+    'session_attendance', metadata,
+    sa.Column('session_id', sa.Integer, primary_key=True),
+    sa.Column('student_id', sa.Integer, primary_key=True),
+    sa.Column('attended', sa.Boolean),
+    sa.Column('updated_at', sa.DateTime),
+    sa.Column('version', sa.Integer, nullable=False, server_default='0'),
+    sa.Index('idx_session_attendance_student', 'student_id', 'session_id', 'attended'),
+)
+
+sync_state = sa.Table(
+    'sync_state', metadata,
+    sa.Column('feed', sa.Text, primary_key=True),
+    sa.Column('etag', sa.Text),
+    sa.Column('last_modified', sa.Text),
+    sa.Column('results', sa.Integer),
+    sa.Column('last_synced_at', sa.DateTime),
+)
+
+event_sync_state = sa.Table(
+    'event_sync_state', metadata,
+    sa.Column('external_id', sa.Text, primary_key=True),
+    sa.Column('content_hash', sa.Text),
+    sa.Column('synced_at', sa.DateTime),
+)
+
+geocodes = sa.Table(
+    'geocodes', metadata,
+    sa.Column('address', sa.Text, primary_key=True),
+    sa.Column('lat', sa.Float),
+    sa.Column('lng', sa.Float),
+    sa.Column('geocoded_at', sa.DateTime),
+)
+
+EXPORT_TYPES = [(sa.Boolean, 'BOOLEAN'), (sa.Integer, 'INTEGER'), (sa.Float, 'REAL')]
+
+
+def _epoch(text):
+    # Session datetimes are local times written with a Z suffix, like SQLite's strftime('%s', ...) reads them.
+    try:
+        return int(datetime.strptime(text, SESSION_DATETIME_FORMAT).replace(tzinfo=timezone.utc).timestamp())
+    except (TypeError, ValueError):
+        return None
+
+
+def _attended(value):
+    return sa.func.coalesce(sa.func.sum(sa.case((value, 1), else_=0)), 0)
+
+
+class _ResultCursor:
+    """The DB-API cursor surface function_export reads: description and fetchmany()."""
+
+    def __init__(self, result):
+        self._result = result
+        self.description = result.cursor.description
+
+    def fetchmany(self, size):
+        return self._result.fetchmany(size)
+
+
+class _ReadConnection:
+    """Executes function_export's qmark SQL on a streaming SQLAlchemy connection."""
+
+    def __init__(self, conn):
+        self._conn = conn.execution_options(stream_results=True)
+        self._qmark = conn.dialect.paramstyle == 'qmark'
+
+    def execute(self, sql, parameters=()):
+        if not self._qmark:
+            sql = sql.replace('?', '%s')
+        return _ResultCursor(self._conn.exec_driver_sql(sql, tuple(parameters)))
+
+
+class SQLAlchemyRepository:
+    """The function_db repository functions on a pooled SQLAlchemy engine.
+
+    Methods take the same arguments and return the same shapes as their
+    function_db counterparts. Reads are not cached in-process: with several
+    replicas on one database, a write on one could not invalidate the others.
+    Full-text search falls back to case-insensitive substring matching and
+    statistics are aggregated on read.
+    """
+
+    def __init__(self, url, pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW):
+        url = sa.make_url(url)
+        backend = url.get_backend_name()
+        if backend not in INSERTS:
+            raise ValueError(f"Unsupported database backend: {backend} (use one of {', '.join(INSERTS)})")
+        if backend == 'sqlite':
+            # Local stand-in; an in-memory database only exists on its one connection.
+            options = {'connect_args': {'check_same_thread': False, 'timeout': db.BUSY_TIMEOUT_SECONDS}}
+            if url.database in (None, '', ':memory:'):
+                options['poolclass'] = sa.pool.StaticPool
+        else:
+            options = {'pool_size': pool_size, 'max_overflow': max_overflow, 'pool_timeout': POOL_TIMEOUT_SECONDS,
+                       'pool_recycle': POOL_RECYCLE_SECONDS, 'pool_pre_ping': True}
+        self.engine = sa.create_engine(url, **options)
+        self._insert = INSERTS[backend]
+        sa.event.listen(self.engine, 'before_cursor_execute', self._before_execute)
+        sa.event.listen(self.engine, 'after_cursor_execute', self._after_execute)
+        sa.event.listen(self.engine, 'handle_error', self._on_error)
+
+    @staticmethod
+    def _before_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault('query_started', []).append((time.perf_counter(), time.time(), perf.current_span()))
+
+    @staticmethod
+    def _after_execute(conn, cursor, statement, parameters, context, executemany):
+        started, started_at, parent = conn.info['query_started'].pop()
+        rows = cursor.rowcount if cursor.rowcount >= 0 else None
+        perf.record_query(statement, time.perf_counter() - started, rows, parent, started_at)
+
+    @staticmethod
+    def _on_error(context):
+        # A failed statement never reaches after_cursor_execute; drop its start so
+        # the next statement is not timed from it.
+        if context.execution_context is not None and context.connection is not None:
+            started = context.connection.info.get('query_started')
+            if started:
+                started.pop()
+
+    def init_db(self):
+        metadata.create_all(self.engine)
+        # create_all only creates missing tables; columns added later are added here.
+        if 'results' not in {c['name'] for c in sa.inspect(self.engine).get_columns('sync_state')}:
+            with self.engine.begin() as conn:
+                conn.execute(sa.text('ALTER TABLE sync_state ADD COLUMN results INTEGER'))
+
+    def close(self):
+        self.engine.dispose()
+
+    # Reads
+
+    def _rows(self, query):
+        with self.engine.connect() as conn:
+            return [dict(r) for r in conn.execute(query).mappings()]
+
+    def _read_frame(self, query):
+        import pandas as pd
+        with self.engine.connect() as conn:
+            return pd.read_sql(query, conn)
+
+    def get_events(self):
+        return self._rows(sa.select(events))
+
+    def get_students(self):
+        return self._rows(sa.select(students))
+
+    @staticmethod
+    def _columns(table, columns):
+        columns = columns or list(table.c.keys())
+        unknown = set(columns) - set(table.c.keys())
+        if unknown:
+            raise ValueError(f"Unknown {table.name} column(s): {sorted(unknown)}")
+        return [table.c[c] for c in columns]
+
+    @staticmethod
+    def _matches(table, fields, search):
+        return sa.or_(*(table.c[f].icontains(search, autoescape=True) for f in fields))
+
+    def _search(self, table, search_fields, query, columns, limit):
+        query = query.strip()
+        if not query:
+            return []
+        return self._rows(sa.select(*self._columns(table, columns))
+                          .where(self._matches(table, search_fields, query)).order_by(table.c.id).limit(limit))
+
+    def search_events(self, query, limit=20, columns=None):
+        return self._search(events, db.EVENT_SEARCH_FIELDS, query, columns, limit)
+
+    def search_students(self, query, limit=20, columns=None):
+        return self._search(students, db.STUDENT_SEARCH_FIELDS, query, columns, limit)
+
+    def _event_filters(self, event_ids=None, start_date_from=None, start_date_to=None, search=None, bbox=None):
+        where = []
+        if event_ids is not None:
+            where.append(events.c.id.in_(event_ids))
+        if bbox is not None:
+            min_lat, min_lng, max_lat, max_lng = bbox
+            where += [events.c.location_lat.between(min_lat, max_lat), events.c.location_lng.between(min_lng, max_lng)]
+        if start_date_from is not None:
+            where.append(events.c.start_date >= str(start_date_from))
+        if start_date_to is not None:
+            where.append(events.c.start_date <= str(start_date_to))
+        if search:
+            where.append(self._matches(events, db.EVENT_SEARCH_FIELDS, search))
+        return where
+
+    def _student_filters(self, student_ids=None, search=None, region=None, school=None):
+        where = []
+        if student_ids is not None:
+            where.append(students.c.id.in_(student_ids))
+        if region:
+            where.append(students.c.region == region)
+        if school:
+            where.append(students.c.school == school)
+        if search:
+            where.append(self._matches(students, db.STUDENT_SEARCH_FIELDS, search))
+        return where
+
+    def _select(self, table, columns, where, order_by, descending, limit, offset, after):
+        if order_by not in table.c:
+            raise ValueError(f"Unknown {table.name} column(s): {order_by}")
+        keys = (table.c[order_by], table.c.id)
+        query = sa.select(*self._columns(table, columns)).where(*where)
+        if after is not None:
+            # Keyset pagination: ``after`` is the (order_by value, id) of the last row seen.
+            after = sa.tuple_(*(sa.literal(value) for value in after))
+            query = query.where(sa.tuple_(*keys) < after if descending else sa.tuple_(*keys) > after)
+        query = query.order_by(*(k.desc() if descending else k.asc() for k in keys))
+        if limit is not None:
+            query = query.limit(limit).offset(offset or 0)
+        return self._rows(query)
+
+    def _count(self, table, where):
+        with self.engine.connect() as conn:
+            return conn.execute(sa.select(sa.func.count()).select_from(table).where(*where)).scalar_one()
+
+    def query_events(self, columns=None, order_by='start_date', descending=False, limit=None, offset=None,
+                     after=None, **filters):
+        return self._select(events, columns, self._event_filters(**filters), order_by, descending, limit, offset, after)
+
+    def count_events(self, **filters):
+        return self._count(events, self._event_filters(**filters))
+
+    def query_students(self, columns=None, order_by='id', descending=False, limit=None, offset=None,
+                       after=None, **filters):
+        return self._select(students, columns, self._student_filters(**filters), order_by, descending, limit,
+                            offset, after)
+
+    def count_students(self, **filters):
+        return self._count(students, self._student_filters(**filters))
+
+    def _registered_filters(self, event_id, **filters):
+        registered = sa.select(attendance.c.student_id).where(attendance.c.event_id == event_id)
+        return [*self._student_filters(**filters), students.c.id.in_(registered)]
+
+    def query_registered_students(self, event_id, columns=None, order_by='name', descending=False, limit=None,
+                                  offset=None, after=None, **filters):
+        return self._select(students, columns, self._registered_filters(event_id, **filters), order_by, descending,
+                            limit, offset, after)
+
+    def count_registered_students(self, event_id, **filters):
+        return self._count(students, self._registered_filters(event_id, **filters))
+
+    def nearest_events(self, lat, lng, k=10, columns=None, max_km=db.KNN_MAX_RADIUS_KM, **filters):
+        columns = list(dict.fromkeys([*(columns or ['id', 'name_tc', 'start_date']), 'location_lat', 'location_lng']))
+        return db._nearest(lat, lng, k, max_km, lambda bbox: self._select(
+            events, columns, self._event_filters(bbox=bbox, **filters), 'id', False, None, None, None))
+
+    def get_geocode(self, address):
+        with self.engine.connect() as conn:
+            row = conn.execute(sa.select(geocodes.c.lat, geocodes.c.lng).where(geocodes.c.address == address)).first()
+        return tuple(row) if row else None
+
+    def save_geocode(self, address, lat, lng):
+        stmt = self._insert(geocodes).values(address=address, lat=lat, lng=lng, geocoded_at=datetime.now())
+        with self.engine.begin() as conn:
+            conn.execute(stmt.on_conflict_do_update(index_elements=['address'], set_={
+                'lat': stmt.excluded.lat, 'lng': stmt.excluded.lng, 'geocoded_at': stmt.excluded.geocoded_at}))
+
+    def get_student_attendance(self, student_id):
+        with self.engine.connect() as conn:
+            return [tuple(r) for r in conn.execute(
+                sa.select(events.c.name_tc, events.c.start_date, attendance.c.attended)
+                .join_from(attendance, events, attendance.c.event_id == events.c.id)
+                .where(attendance.c.student_id == student_id))]
+
+    def get_student_stats(self, student_id):
+        with self.engine.connect() as conn:
+            registered, attended = conn.execute(sa.select(sa.func.count(), _attended(attendance.c.attended))
+                                                .where(attendance.c.student_id == student_id)).one()
+        return {'registered': registered, 'attended': attended}
+
+    def get_event_stats(self, event_id):
+        with self.engine.connect() as conn:
+            quota = conn.execute(sa.select(events.c.quota).where(events.c.id == event_id)).scalar()
+            registered, attended = conn.execute(sa.select(sa.func.count(), _attended(attendance.c.attended))
+                                                 .where(attendance.c.event_id == event_id)).one()
+        return {'registered': registered, 'attended': attended, 'quota': quota,
+                'fill_rate': registered / quota if quota else None,
+                'attendance_rate': attended / registered if registered else None}
+
+    def get_monthly_stats(self, limit=12):
+        month = sa.func.substr(events.c.start_date, 1, 7).label('month')
+        query = (sa.select(month, sa.func.count(), _attended(attendance.c.attended))
+                 .join_from(attendance, events, attendance.c.event_id == events.c.id)
+                 .where(events.c.start_date.is_not(None), events.c.start_date != '')
+                 .group_by(month).order_by(month.desc()).limit(limit))
+        with self.engine.connect() as conn:
+            rows = conn.execute(query).all()
+        return [{'month': m, 'registered': r, 'attended': a} for m, r, a in reversed(rows)]
+
+    def get_overview_stats(self):
+        with self.engine.connect() as conn:
+            registered, attended = conn.execute(sa.select(sa.func.count(), _attended(attendance.c.attended))).one()
+            student_count = conn.execute(sa.select(sa.func.count()).select_from(students)).scalar_one()
+            event_count = conn.execute(sa.select(sa.func.count()).select_from(events)).scalar_one()
+        return {'students': student_count, 'events': event_count, 'registrations': registered, 'attended': attended,
+                'attendance_rate': attended / registered if registered else None}
+
+    def get_event_sessions(self, event_id):
+        rows = self._rows(sa.select(event_sessions.c.id, event_sessions.c.session_no, event_sessions.c.start_datetime,
+                                    event_sessions.c.end_datetime)
+                          .where(event_sessions.c.event_id == event_id).order_by(event_sessions.c.session_no))
+        for row in rows:
+            row['start_at'], row['end_at'] = _epoch(row['start_datetime']), _epoch(row['end_datetime'])
+        return rows
+
+    def get_upcoming_sessions(self, days=7, limit=50, now=None):
+        # The fixed-width text datetimes sort like the instants they name.
+        now = now or datetime.now()
+        start, end = now.strftime(SESSION_DATETIME_FORMAT), (now + timedelta(days=days)).strftime(SESSION_DATETIME_FORMAT)
+        s = event_sessions
+        return self._rows(sa.select(s.c.id, s.c.event_id, s.c.session_no, s.c.start_datetime, s.c.end_datetime,
+                                    events.c.name_tc, events.c.location_address_tc)
+                          .join_from(s, events, events.c.id == s.c.event_id)
+                          .where(s.c.start_datetime >= start, s.c.start_datetime < end)
+                          .order_by(s.c.start_datetime).limit(limit))
+
+    def get_session_attendance_records(self, session_id):
+        s, a, sa_ = event_sessions, attendance, session_attendance
+        return self._read_frame(
+            sa.select(students.c.id.label('student_id'), students.c.name,
+                      sa.func.coalesce(sa_.c.attended, False).label('attended'),
+                      sa.func.coalesce(sa_.c.version, 0).label('version'))
+            .select_from(s)
+            .join(a, a.c.event_id == s.c.event_id)
+            .join(students, students.c.id == a.c.student_id)
+            .outerjoin(sa_, sa.and_(sa_.c.session_id == s.c.id, sa_.c.student_id == a.c.student_id))
+            .where(s.c.id == session_id))
+
+    def get_student_keys(self):
+        return self._read_frame(sa.select(students.c.name, students.c.contact))
+
+    def get_student_schools(self):
+        with self.engine.connect() as conn:
+            return list(conn.execute(sa.select(students.c.school).distinct()
+                                     .where(students.c.school.is_not(None), students.c.school != '')
+                                     .order_by(students.c.school)).scalars())
+
+    def get_current_registrations(self, event_id):
+        with self.engine.connect() as conn:
+            return list(conn.execute(sa.select(attendance.c.student_id)
+                                     .where(attendance.c.event_id == event_id)).scalars())
+
+    def _registration_versions(self, conn, event_id):
+        return dict(conn.execute(sa.select(attendance.c.student_id, attendance.c.version)
+                                 .where(attendance.c.event_id == event_id)).all())
+
+    def get_registration_versions(self, event_id):
+        with self.engine.connect() as conn:
+            return self._registration_versions(conn, event_id)
+
+    def get_attendance_records(self, event_id):
+        return self._read_frame(
+            sa.select(students.c.id.label('student_id'), students.c.name, attendance.c.attended, attendance.c.version)
+            .join_from(attendance, students, attendance.c.student_id == students.c.id)
+            .where(attendance.c.event_id == event_id))
+
+    # Writes
+
+    @staticmethod
+    def _compare_and_swap(conn, table, key, key_value, changes, now):
+        # One UPDATE per new flag value, matching (student_id, version read) pairs.
+        written = set()
+        for attended in (0, 1):
+            pairs = [(student_id, version) for student_id, flag, version in changes if flag == attended]
+            if pairs:
+                written.update(conn.execute(
+                    table.update()
+                    .where(key == key_value, sa.tuple_(table.c.student_id, table.c.version).in_(pairs))
+                    .values(attended=bool(attended), version=table.c.version + 1, updated_at=now)
+                    .returning(table.c.student_id)).scalars())
+        return written
+
+    def update_attendance_records(self, edited_attendance, event_id, original_attendance):
+        changes, count = db._attendance_changes(edited_attendance, original_attendance)
+        if not count:
+            return {'written': 0, 'conflicts': []}
+        changes = json.loads(changes)
+        with self.engine.begin() as conn:
+            written = self._compare_and_swap(conn, attendance, attendance.c.event_id, event_id, changes, datetime.now())
+        return {'written': len(written), 'conflicts': [r[0] for r in changes if r[0] not in written]}
+
+    def update_session_attendance_records(self, edited_attendance, session_id, original_attendance):
+        changes, count = db._attendance_changes(edited_attendance, original_attendance)
+        if not count:
+            return {'written': 0, 'conflicts': []}
+        changes = json.loads(changes)
+        now = datetime.now()
+        # A missing row was read as version 0; it is inserted unless someone else inserted it first.
+        new = [{'session_id': session_id, 'student_id': student_id, 'attended': bool(attended), 'version': 1,
+                'updated_at': now} for student_id, attended, version in changes if version == 0]
+        with self.engine.begin() as conn:
+            written = self._compare_and_swap(conn, session_attendance, session_attendance.c.session_id, session_id,
+                                             [c for c in changes if c[2] != 0], now)
+            if new:
+                written.update(conn.execute(self._insert(session_attendance).values(new).on_conflict_do_nothing()
+                                            .returning(session_attendance.c.student_id)).scalars())
+        return {'written': len(written), 'conflicts': [r[0] for r in changes if r[0] not in written]}
+
+    def _replace_event_sessions(self, conn, event_id, datetimes):
+        # Sessions are matched by position so per-session attendance survives re-syncs.
+        if datetimes:
+            stmt = self._insert(event_sessions).values([
+                {'event_id': event_id, 'session_no': no, 'start_datetime': start, 'end_datetime': end}
+                for no, (start, end) in enumerate(datetimes, start=1)])
+            conn.execute(stmt.on_conflict_do_update(index_elements=['event_id', 'session_no'], set_={
+                'start_datetime': stmt.excluded.start_datetime, 'end_datetime': stmt.excluded.end_datetime}))
+        conn.execute(event_sessions.delete().where(event_sessions.c.event_id == event_id,
+                                                   event_sessions.c.session_no > len(datetimes)))
+
+    def save_event(self, event):
+        values = {f: event.get(f) for f in db.SYNCED_EVENT_FIELDS if f != 'external_id'}
+        with self.engine.begin() as conn:
+            if 'id' in event:
+                query = events.update().where(events.c.id == event['id'])
+                if event.get('version') is not None:
+                    query = query.where(events.c.version == event['version'])
+                if conn.execute(query.values(**values, version=events.c.version + 1)).rowcount == 0:
+                    raise db.ConflictError(f"Event {event['id']} was changed or deleted by someone else")
+                event_id = event['id']
+            else:
+                event_id = conn.execute(events.insert().values(**values, created_at=datetime.now())
+                                        .returning(events.c.id)).scalar_one()
+            self._replace_event_sessions(conn, event_id, db.event_session_datetimes(
+                event['sessions'], event.get('accurate_start_datetime'), event.get('accurate_end_datetime')))
+
+    def save_student(self, student):
+        values = {f: student[f] for f in db.STUDENT_IMPORT_FIELDS}
+        with self.engine.begin() as conn:
+            if 'id' in student:
+                conn.execute(students.update().where(students.c.id == student['id']).values(**values))
+            else:
+                conn.execute(students.insert().values(**values, registered_at=datetime.now()))
+
+    def insert_students(self, rows):
+        now = datetime.now()
+        rows = [{**dict(zip(db.STUDENT_IMPORT_FIELDS, row)), 'registered_at': now} for row in rows]
+        if rows:
+            with self.engine.begin() as conn:
+                conn.execute(students.insert(), rows)
+        return len(rows)
+
+    def save_registration_changes(self, event_id, selected_ids, original=None):
+        selected_ids = set(selected_ids)
+        now = datetime.now()
+        with self.engine.begin() as conn:
+            if original is None:
+                original = self._registration_versions(conn, event_id)
+            removals = [(student_id, version) for student_id, version in original.items()
+                        if student_id not in selected_ids]
+            removed, conflicts = set(), []
+            if removals:
+                removed = set(conn.execute(
+                    attendance.delete()
+                    .where(attendance.c.event_id == event_id,
+                           sa.tuple_(attendance.c.student_id, attendance.c.version).in_(removals))
+                    .returning(attendance.c.student_id)).scalars())
+                conflicts = list(conn.execute(
+                    sa.select(attendance.c.student_id)
+                    .where(attendance.c.event_id == event_id,
+                           attendance.c.student_id.in_([s for s, _ in removals if s not in removed]))).scalars())
+            additions = [{'event_id': event_id, 'student_id': student_id, 'attended': False, 'updated_at': now}
+                         for student_id in selected_ids - original.keys()]
+            added = 0
+            if additions:
+                added = len(conn.execute(self._insert(attendance).values(additions).on_conflict_do_nothing()
+                                         .returning(attendance.c.student_id)).all())
+        return {'added': added, 'removed': len(removed), 'conflicts': conflicts}
+
+    def register_cohort(self, event_id, **filters):
+        # The always-true WHERE keeps SQLite from reading ON CONFLICT as a join constraint.
+        query = (sa.select(sa.literal(event_id), students.c.id, sa.literal(False), sa.literal(datetime.now()))
+                 .where(sa.true(), *self._student_filters(**filters)))
+        with self.engine.begin() as conn:
+            return conn.execute(
+                self._insert(attendance)
+                .from_select(['event_id', 'student_id', 'attended', 'updated_at'], query)
+                .on_conflict_do_nothing()).rowcount
+
+    # External sync
+
+    def get_feed_states(self):
+        with self.engine.connect() as conn:
+            return {feed: (etag, last_modified, results) for feed, etag, last_modified, results in conn.execute(
+                sa.select(sync_state.c.feed, sync_state.c.etag, sync_state.c.last_modified, sync_state.c.results))}
+
+    def save_synced_events(self, synced, feeds):
+        stats = {'inserted': 0, 'updated': 0, 'skipped': 0}
+        now = datetime.now()
+        with self.engine.begin() as conn:
+            known_hashes = dict(conn.execute(sa.select(event_sync_state.c.external_id,
+                                                       event_sync_state.c.content_hash)).all())
+            existing_ids = set(conn.execute(sa.select(events.c.external_id)
+                                            .where(events.c.external_id.is_not(None))).scalars())
+            rows, hashes = db._changed_synced_events(synced, known_hashes, existing_ids, stats)
+            if rows:
+                stmt = self._insert(events).values([{**row, 'created_at': now} for row in rows.values()])
+                conn.execute(stmt.on_conflict_do_update(index_elements=['external_id'], set_={
+                    **{c: stmt.excluded[c] for c in db.SYNCED_EVENT_FIELDS if c != 'external_id'},
+                    'version': events.c.version + 1}))
+                stmt = self._insert(event_sync_state).values([
+                    {'external_id': external_id, 'content_hash': digest, 'synced_at': now}
+                    for external_id, digest in hashes.items()])
+                conn.execute(stmt.on_conflict_do_update(index_elements=['external_id'], set_={
+                    'content_hash': stmt.excluded.content_hash, 'synced_at': stmt.excluded.synced_at}))
+                event_ids = dict(conn.execute(sa.select(events.c.external_id, events.c.id)
+                                              .where(events.c.external_id.in_(list(rows)))).all())
+                for external_id, row in rows.items():
+                    self._replace_event_sessions(conn, event_ids[external_id], db.event_session_datetimes(row['sessions']))
+            if feeds:
+                stmt = self._insert(sync_state).values([
+                    {'feed': url, 'etag': etag, 'last_modified': last_modified, 'results': results, 'last_synced_at': now}
+                    for url, etag, last_modified, results in feeds])
+                conn.execute(stmt.on_conflict_do_update(index_elements=['feed'], set_={
+                    'etag': sa.func.coalesce(stmt.excluded.etag, sync_state.c.etag),
+                    'last_modified': sa.func.coalesce(stmt.excluded.last_modified, sync_state.c.last_modified),
+                    'results': sa.func.coalesce(stmt.excluded.results, sync_state.c.results),
+                    'last_synced_at': stmt.excluded.last_synced_at}))
+        return {**stats, 'rows': rows}
+
+    # Diagnostics and export
+
+    def _hot_queries(self):
+        return {
+            'student_attendance': sa.select(events.c.name_tc, attendance.c.attended)
+                .join_from(attendance, events, attendance.c.event_id == events.c.id)
+                .where(attendance.c.student_id == 1),
+            'event_attendance': sa.select(students.c.name, attendance.c.attended)
+                .join_from(attendance, students, attendance.c.student_id == students.c.id)
+                .where(attendance.c.event_id == 1),
+            'upcoming_events': sa.select(events).where(events.c.start_date >= '2000-01-01')
+                .order_by(events.c.start_date).limit(5),
+            'upcoming_sessions': sa.select(event_sessions.c.id)
+                .where(event_sessions.c.start_datetime >= '2000-01-01').order_by(event_sessions.c.start_datetime)
+                .limit(50),
+            'event_by_external_id': sa.select(events.c.id).where(events.c.external_id == ''),
+        }
+
+    def find_full_scans(self, queries=None):
+        is_sqlite = self.engine.dialect.name == 'sqlite'
+        full_scans = {}
+        with self.engine.connect() as conn:
+            for name, query in (queries or self._hot_queries()).items():
+                sql = str(query.compile(self.engine, compile_kwargs={'literal_binds': True}))
+                if is_sqlite:
+                    plan = [r[-1] for r in conn.exec_driver_sql(f"EXPLAIN QUERY PLAN {sql}")]
+                    scans = [d for d in plan if d.startswith('SCAN') and 'INDEX' not in d]
+                else:
+                    plan = [r[0] for r in conn.exec_driver_sql(f"EXPLAIN {sql}")]
+                    scans = [d.strip() for d in plan if 'Seq Scan' in d]
+                if scans:
+                    full_scans[name] = scans
+        return full_scans
+
+    def column_types(self, table):
+        types = {}
+        for column in metadata.tables[table].columns:
+            types[column.name] = next((name for t, name in EXPORT_TYPES if isinstance(column.type, t)), 'TEXT')
+        return types
+
+    @contextmanager
+    def read_connection(self):
+        with self.engine.connect() as conn:
+            yield _ReadConnection(conn)
@@ -0,0 +1,321 @@
+import asyncio
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlencode
+
+import function_db as db
+import function_perf as perf
+import function_thumbnails as thumbnails
+
+API_BASE_URL = "https://striveandrise.gov.hk/api/activities"
+# Each target group is fetched as a separate feed; activities listed in more
+# than one feed are merged by external_id.
+TARGET_GROUPS = ['SKHWC']
+HITS_PER_PAGE = 1000
+PAGE_PARAM = 'page'
+MAX_CONCURRENT_REQUESTS = 4
+MAX_RETRIES = 3
+RETRY_BACKOFF_SECONDS = 0.5
+REQUEST_TIMEOUT = 30
+# Minimum number of seconds between two syncs in the same process; Streamlit
+# reruns inside this window reuse the last result instead of hitting the API.
+SYNC_TTL_SECONDS = 15 * 60
+
+# Background refresher settings.
+REFRESH_INTERVAL_SECONDS = 15 * 60
+BACKOFF_BASE_SECONDS = 30
+BACKOFF_MAX_SECONDS = 30 * 60
+BACKOFF_JITTER = 0.2
+
+EVENT_COLUMNS = db.SYNCED_EVENT_FIELDS
+
+_sync_lock = threading.Lock()
+_last_sync_at = None
+_last_stats = None
+_refresher = None
+_refresher_lock = threading.Lock()
+
+
+def event_to_row(event):
+    session = event['sessions'][0] if event['sessions'] else {}
+    accurate_start_datetime = f"{session.get('startDate', '')}T{session.get('startTime', '')}:00Z" if session else None
+    accurate_end_datetime = f"{session.get('endDate', '')}T{session.get('endTime', '')}:00Z" if session else accurate_start_datetime
+    lat_lng = event['locationLatLng']
+    return {
+        'external_id': event['subActivityCode'] if event.get('subActivityCode') and event['subActivityCode'] != "" else event['activityCode'],
+        'name_tc': event['name_tc'],
+        'name_en': event['name_en'],
+        'description_tc': event['description_tc'],
+        'start_date': session.get('startDate') if session else None,
+        'end_date': session.get('endDate') if session else None,
+        'location_address_tc': event['locationAddress_tc'],
+        'location_lat': (lat_lng.get('lat') or None) if lat_lng else None,
+        'location_lng': (lat_lng.get('lng') or None) if lat_lng else None,
+        'quota': event['quota'],
+        'organizer_tc': event['supportingOrganiserName_tc'],
+        'activity_nature_tc': event['activityNature']['name_tc'],
+        'sessions': json.dumps(event['sessions'], ensure_ascii=False),
+        'thumbnail_url': event['thumbnailUrl_tc'],
+        'accurate_start_datetime': accurate_start_datetime,
+        'accurate_end_datetime': accurate_end_datetime,
+    }
+
+
+def content_hash(event):
+    payload = json.dumps(event, sort_keys=True, ensure_ascii=False, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def feed_url(base_url, target_group, page=1, hits=HITS_PER_PAGE):
+    params = {'hits': hits, 'targetGroups': target_group}
+    # The first page keeps the original URL so its stored ETag stays valid.
+    if page > 1:
+        params[PAGE_PARAM] = page
+    return f"{base_url}?{urlencode(params)}"
+
+
+def _retryable(error):
+    # Connection failures, timeouts and 5xx responses may pass; 4xx responses will not.
+    import requests
+    if isinstance(error, requests.HTTPError):
+        return error.response is not None and error.response.status_code >= 500
+    return isinstance(error, (requests.ConnectionError, requests.Timeout))
+
+
+async def _gather(awaitables):
+    # Waits for every request before raising, so none is still using the session when it closes.
+    results = await asyncio.gather(*awaitables, return_exceptions=True)
+    for result in results:
+        if isinstance(result, BaseException):
+            raise result
+    return results
+
+
+class _Fetcher:
+    """Fetches feed pages concurrently: requests run in worker threads, bounded by a semaphore."""
+
+    def __init__(self, states, timeout, max_concurrency, max_retries):
+        import requests
+        self.session = requests.Session()
+        self.states = states
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.semaphore = asyncio.Semaphore(max_concurrency)
+        self.requests = 0
+
+    def _get(self, url):
+        headers = {}
+        etag, last_modified, _ = self.states.get(url, (None, None, None))
+        if etag:
+            headers['If-None-Match'] = etag
+        if last_modified:
+            headers['If-Modified-Since'] = last_modified
+        with perf.timed("同步.HTTP請求", url=url) as span:
+            response = self.session.get(url, headers=headers, timeout=self.timeout)
+            span['attributes']['status_code'] = response.status_code
+        if response.status_code == 304:
+            return None
+        response.raise_for_status()
+        return response.json(), response.headers.get('ETag'), response.headers.get('Last-Modified')
+
+    async def get(self, url):
+        """Returns (url, payload, etag, last_modified, results).
+
+        ``payload`` is None when the page is unchanged; ``results`` is then the
+        page's activity count from the last sync.
+        """
+        for attempt in range(self.max_retries + 1):
+            try:
+                async with self.semaphore:
+                    self.requests += 1
+                    # Not cancelled from here: the requests timeout ends the call, so the
+                    # worker thread never outlives its semaphore slot.
+                    result = await asyncio.to_thread(self._get, url)
+                break
+            except Exception as e:
+                if attempt == self.max_retries or not _retryable(e):
+                    raise
+                await asyncio.sleep(RETRY_BACKOFF_SECONDS * 2 ** attempt)
+        if result is None:
+            return url, None, None, None, self.states.get(url, (None, None, None))[2]
+        payload, etag, last_modified = result
+        return url, payload, etag, last_modified, len(payload.get('results', []))
+
+    async def fetch_feed(self, base_url, target_group, hits):
+        # Every page is requested conditionally; only pages answering 304 are skipped.
+        first = await self.get(feed_url(base_url, target_group, 1, hits))
+        total = first[1].get('total', first[1].get('totalHits')) if first[1] is not None else None
+        if total is not None:
+            page_count = math.ceil(total / hits)
+        else:
+            # Size unknown (no total, or page 1 unchanged): start with the pages seen last time.
+            page_count = 1
+            while feed_url(base_url, target_group, page_count + 1, hits) in self.states:
+                page_count += 1
+        rest = await _gather(self.get(feed_url(base_url, target_group, page, hits))
+                             for page in range(2, page_count + 1))
+        pages = [first, *rest]
+        # Then keep paging while the last page is full; an unknown size counts as full.
+        while total is None and (pages[-1][4] is None or pages[-1][4] >= hits):
+            pages.append(await self.get(feed_url(base_url, target_group, len(pages) + 1, hits)))
+        return pages
+
+    async def fetch_all(self, base_url, target_groups, hits):
+        try:
+            feeds = await _gather(self.fetch_feed(base_url, g, hits) for g in target_groups)
+        finally:
+            self.session.close()
+        return [page for pages in feeds for page in pages]
+
+
+def _sync(base_url, target_groups, timeout, max_concurrency, max_retries, hits):
+    started = time.perf_counter()
+    stats = {'fetched': 0, 'inserted': 0, 'updated': 0, 'skipped': 0, 'requests': 0,
+             'not_modified': False, 'thumbnails': 0, 'elapsed': 0.0}
+    states = db.get_feed_states()
+    # Fetch outside the connection so a slow API does not hold a pooled connection.
+    fetcher = _Fetcher(states, timeout, max_concurrency, max_retries)
+    with perf.timed("同步.抓取", feeds=len(target_groups)):
+        pages = asyncio.run(fetcher.fetch_all(base_url, target_groups, hits))
+    stats['requests'] = fetcher.requests
+
+    events = [event for _, payload, _, _, _ in pages if payload is not None for event in payload.get('results', [])]
+    stats['fetched'] = len(events)
+    stats['not_modified'] = all(payload is None for _, payload, _, _, _ in pages)
+    with perf.timed("同步.寫入", events=len(events)):
+        written = db.save_synced_events([(event_to_row(event), content_hash(event)) for event in events],
+                                        [(url, etag, last_modified, results)
+                                         for url, _, etag, last_modified, results in pages])
+    rows = written.pop('rows')
+    stats.update(written)
+    # New and changed events get their thumbnails cached ahead of the first view.
+    try:
+        stats['thumbnails'] = thumbnails.prefetch(row['thumbnail_url'] for row in rows.values())['downloaded']
+    except Exception as e:
+        print(f"Error prefetching thumbnails: {e}")
+    stats['elapsed'] = time.perf_counter() - started
+    return stats
+
+
+def sync_external_events(force=False, base_url=API_BASE_URL, target_groups=None, timeout=REQUEST_TIMEOUT,
+                         ttl=SYNC_TTL_SECONDS, max_concurrency=MAX_CONCURRENT_REQUESTS,
+                         max_retries=MAX_RETRIES, hits=HITS_PER_PAGE):
+    """Sync external activities from every target group feed into the events table.
+
+    Returns a dict with fetched/inserted/updated/skipped counts and the elapsed
+    time, or None when the last sync in this process is younger than ``ttl``.
+    """
+    global _last_sync_at, _last_stats
+    with _sync_lock:
+        if not force and _last_sync_at is not None and time.monotonic() - _last_sync_at < ttl:
+            return None
+        try:
+            with perf.timed("同步.外部活動", force=force) as span:
+                _last_stats = _sync(base_url, target_groups or TARGET_GROUPS, timeout,
+                                    max_concurrency, max_retries, hits)
+                span['attributes'].update(_last_stats)
+        finally:
+            _last_sync_at = time.monotonic()
+        return _last_stats
+
+
+def last_sync_stats():
+    return _last_stats
+
+
+class ExternalEventRefresher:
+    """Process-wide daemon thread that keeps the events table in sync.
+
+    Failures are retried with exponential backoff plus jitter; ``status()``
+    exposes the outcome of the last run for display in the UI.
+    """
+
+    def __init__(self, interval=REFRESH_INTERVAL_SECONDS, timeout=REQUEST_TIMEOUT,
+                 backoff_base=BACKOFF_BASE_SECONDS, backoff_max=BACKOFF_MAX_SECONDS,
+                 jitter=BACKOFF_JITTER, base_url=API_BASE_URL, target_groups=None):
+        self.interval = interval
+        self.timeout = timeout
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.base_url = base_url
+        self.target_groups = target_groups
+        self._thread = None
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._done = threading.Condition()
+        self._runs = 0
+        self._failures = 0
+        self._status = {'running': False, 'last_success_at': None, 'last_error': None,
+                        'last_error_at': None, 'last_duration': None, 'last_stats': None,
+                        'next_run_at': None}
+
+    def start(self):
+        with self._done:
+            if self._thread is None or not self._thread.is_alive():
+                self._stop.clear()
+                self._thread = threading.Thread(target=self._run, name='external-event-refresher', daemon=True)
+                self._thread.start()
+        return self
+
+    def stop(self):
+        self._stop.set()
+        self._wake.set()
+
+    def trigger(self, wait_timeout=None):
+        """Run a refresh now; optionally block up to ``wait_timeout`` seconds for it to finish."""
+        with self._done:
+            # A run already in progress may have fetched before this call.
+            target = self._runs + (2 if self._status['running'] else 1)
+            self._wake.set()
+            if wait_timeout is not None:
+                self._done.wait_for(lambda: self._runs >= target, timeout=wait_timeout)
+        return self.status()
+
+    def status(self):
+        with self._done:
+            return dict(self._status)
+
+    def _next_delay(self):
+        if not self._failures:
+            return self.interval
+        delay = min(self.backoff_max, self.backoff_base * 2 ** (self._failures - 1))
+        return delay * (1 + random.uniform(-self.jitter, self.jitter))
+
+    def _run(self):
+        while not self._stop.is_set():
+            started = time.perf_counter()
+            with self._done:
+                self._status['running'] = True
+            try:
+                stats = sync_external_events(force=True, base_url=self.base_url,
+                                             target_groups=self.target_groups, timeout=self.timeout)
+            except Exception as e:
+                self._failures += 1
+                print(f"Error fetching and saving external events: {e}")
+                outcome = {'last_error': str(e), 'last_error_at': datetime.now()}
+            else:
+                self._failures = 0
+                outcome = {'last_success_at': datetime.now(), 'last_error': None, 'last_stats': stats}
+            delay = self._next_delay()
+            # One update, so readers never see a finished run without its duration.
+            with self._done:
+                self._status.update(outcome, running=False, last_duration=time.perf_counter() - started,
+                                    next_run_at=datetime.fromtimestamp(time.time() + delay))
+                self._runs += 1
+                self._done.notify_all()
+            self._wake.wait(delay)
+            self._wake.clear()
+
+
+def get_refresher():
+    global _refresher
+    with _refresher_lock:
+        if _refresher is None:
+            _refresher = ExternalEventRefresher()
+        return _refresher
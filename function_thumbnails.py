@@ -0,0 +1,240 @@
+import asyncio
+import hashlib
+import io
+import os
+import threading
+from datetime import datetime, timedelta
+
+import function_db as db
+import function_perf as perf
+from function_cache import cached, invalidate
+
+# Event thumbnails are downloaded once, resized for display and kept on disk,
+# named by the hash of their content; the thumbnails table maps each remote
+# URL to its file. Least recently served files are evicted past CACHE_MAX_BYTES.
+CACHE_DIR = None  # default: a "thumbnails" directory next to the database
+CACHE_MAX_BYTES = 200 * 1024 * 1024
+EVICT_TO_RATIO = 0.9
+THUMBNAIL_SIZE = (600, 600)  # shown at 300px, doubled for high-DPI screens
+JPEG_QUALITY = 85
+MAX_DOWNLOAD_BYTES = 5 * 1024 * 1024
+MAX_IMAGE_PIXELS = 40_000_000
+DOWNLOAD_TIMEOUT = 10
+PAGE_DOWNLOAD_TIMEOUT = 3  # a cache miss while rendering should not stall the page
+MAX_CONCURRENT_DOWNLOADS = 8
+RETRY_FAILED_AFTER = timedelta(hours=1)
+
+_lock = threading.Lock()
+_metrics = {'hits': 0, 'misses': 0, 'downloads': 0, 'download_failures': 0, 'evictions': 0,
+            'evicted_bytes': 0}
+_total_bytes = None
+
+
+class ThumbnailError(Exception):
+    pass
+
+
+def cache_dir():
+    return CACHE_DIR or os.path.join(os.path.dirname(os.path.abspath(db.DB_NAME)), 'thumbnails')
+
+
+def _path(content_hash):
+    return os.path.join(cache_dir(), content_hash[:2], f"{content_hash}.jpg")
+
+
+def _count(name, n=1):
+    with _lock:
+        _metrics[name] += n
+
+
+def _download(session, url, timeout):
+    with perf.timed("縮圖.下載", url=url):
+        with session.get(url, timeout=timeout, stream=True) as response:
+            response.raise_for_status()
+            length = response.headers.get('Content-Length')
+            if length and int(length) > MAX_DOWNLOAD_BYTES:
+                raise ThumbnailError(f"Image too large ({length} bytes)")
+            data = bytearray()
+            for chunk in response.iter_content(64 * 1024):
+                data += chunk
+                if len(data) > MAX_DOWNLOAD_BYTES:
+                    raise ThumbnailError(f"Image larger than {MAX_DOWNLOAD_BYTES} bytes")
+    return bytes(data)
+
+
+def resize(data):
+    """JPEG bytes of the image scaled to fit THUMBNAIL_SIZE."""
+    from PIL import Image
+    with perf.timed("縮圖.縮放"):
+        with Image.open(io.BytesIO(data)) as image:
+            if image.width * image.height > MAX_IMAGE_PIXELS:
+                raise ThumbnailError(f"Image too large ({image.width}x{image.height})")
+            image.draft('RGB', THUMBNAIL_SIZE)  # lets JPEGs decode at a reduced scale
+            image.thumbnail(THUMBNAIL_SIZE)
+            if image.mode != 'RGB':
+                background = Image.new('RGB', image.size, 'white')
+                background.paste(image, mask=image.convert('RGBA').getchannel('A'))
+                image = background
+            out = io.BytesIO()
+            image.save(out, 'JPEG', quality=JPEG_QUALITY, optimize=True)
+    return out.getvalue()
+
+
+def _store(data):
+    """Write resized bytes under their content hash; returns the hash."""
+    global _total_bytes
+    content_hash = hashlib.sha256(data).hexdigest()
+    path = _path(content_hash)
+    if not os.path.exists(path):
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp = f"{path}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            f.write(data)
+        os.replace(tmp, path)
+        with _lock:
+            if _total_bytes is not None:
+                _total_bytes += len(data)
+    return content_hash
+
+
+def _fetch(session, url, timeout):
+    """Download, resize and store one thumbnail, recording the outcome for ``url``."""
+    try:
+        content_hash = _store(resize(_download(session, url, timeout)))
+        error = None
+        _count('downloads')
+    except Exception as e:
+        content_hash, error = None, str(e)[:500]
+        _count('download_failures')
+    with db.get_connection(immediate=True) as conn:
+        conn.execute('''INSERT INTO thumbnails (url, content_hash, error, fetched_at) VALUES (?,?,?,?)
+                        ON CONFLICT(url) DO UPDATE SET content_hash=excluded.content_hash, error=excluded.error,
+                        fetched_at=excluded.fetched_at''', (url, content_hash, error, datetime.now()))
+    return content_hash
+
+
+@cached('thumbnails')
+def _lookup(url):
+    with db.get_connection() as conn:
+        return conn.execute('''SELECT content_hash, fetched_at FROM thumbnails WHERE url = ?''', (url,)).fetchone()
+
+
+def _needs_fetch(url):
+    row = _lookup(url)
+    if row is None:
+        return True
+    content_hash, fetched_at = row
+    if content_hash:
+        return not os.path.exists(_path(content_hash))
+    return datetime.now() - datetime.fromisoformat(fetched_at) > RETRY_FAILED_AFTER
+
+
+def get(url, timeout=PAGE_DOWNLOAD_TIMEOUT):
+    """The cached thumbnail for ``url`` as JPEG bytes, or None if it cannot be had.
+
+    A miss downloads the image on the spot (with a short timeout) so the next
+    view is a hit; images that recently failed to download are not retried.
+    """
+    if not url:
+        return None
+    row = _lookup(url)
+    if row is not None and row[0]:
+        path = _path(row[0])
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+            os.utime(path)  # recency for LRU eviction
+            _count('hits')
+            return data
+        except FileNotFoundError:
+            pass
+    _count('misses')
+    if not _needs_fetch(url):
+        return None
+    import requests
+    with requests.Session() as session:
+        content_hash = _fetch(session, url, timeout)
+    invalidate('thumbnails')
+    evict()
+    if content_hash is None:
+        return None
+    with open(_path(content_hash), 'rb') as f:
+        return f.read()
+
+
+def prefetch(urls, max_concurrency=MAX_CONCURRENT_DOWNLOADS, timeout=DOWNLOAD_TIMEOUT):
+    """Download every uncached thumbnail in ``urls`` concurrently; returns {'downloaded', 'failed'}."""
+    import requests
+    pending = sorted({url for url in urls if url and _needs_fetch(url)})
+    if not pending:
+        return {'downloaded': 0, 'failed': 0}
+
+    async def fetch_all(session):
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def fetch(url):
+            async with semaphore:
+                return await asyncio.to_thread(_fetch, session, url, timeout)
+        return await asyncio.gather(*(fetch(url) for url in pending))
+
+    with perf.timed("縮圖.預取", urls=len(pending)), requests.Session() as session:
+        results = asyncio.run(fetch_all(session))
+    invalidate('thumbnails')
+    evict()
+    downloaded = sum(1 for r in results if r)
+    return {'downloaded': downloaded, 'failed': len(results) - downloaded}
+
+
+def _files():
+    root = cache_dir()
+    if not os.path.isdir(root):
+        return []
+    return [entry for sub in os.scandir(root) if sub.is_dir()
+            for entry in os.scandir(sub.path) if entry.name.endswith('.jpg')]
+
+
+def evict(max_bytes=None):
+    """Delete least recently served files until the cache is under ``max_bytes``."""
+    global _total_bytes
+    max_bytes = CACHE_MAX_BYTES if max_bytes is None else max_bytes
+    with _lock:
+        if _total_bytes is not None and _total_bytes <= max_bytes:
+            return 0
+    files = _files()
+    sizes = {f.path: f.stat() for f in files}
+    total = sum(s.st_size for s in sizes.values())
+    evicted = []
+    if total > max_bytes:
+        for path, stat in sorted(sizes.items(), key=lambda item: item[1].st_mtime):
+            if total <= max_bytes * EVICT_TO_RATIO:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                continue
+            total -= stat.st_size
+            evicted.append(os.path.basename(path)[:-len('.jpg')])
+            _count('evicted_bytes', stat.st_size)
+    with _lock:
+        _total_bytes = total
+    if evicted:
+        _count('evictions', len(evicted))
+        with db.get_connection(immediate=True) as conn:
+            conn.executemany('''DELETE FROM thumbnails WHERE content_hash = ?''', [(h,) for h in evicted])
+        invalidate('thumbnails')
+    return len(evicted)
+
+
+def stats():
+    global _total_bytes
+    with _lock:
+        total = _total_bytes
+    if total is None:
+        total = sum(f.stat().st_size for f in _files())
+        with _lock:
+            _total_bytes = total
+    with _lock:
+        metrics = dict(_metrics)
+    lookups = metrics['hits'] + metrics['misses']
+    return {**metrics, 'hit_rate': metrics['hits'] / lookups if lookups else None,
+            'bytes': total, 'max_bytes': CACHE_MAX_BYTES}
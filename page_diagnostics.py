@@ -0,0 +1,82 @@
+from datetime import datetime
+import streamlit as st
+import pandas as pd
+import function_cache
+import function_db as db
+import function_perf as perf
+import function_sync as sync
+import function_thumbnails as thumbnails
+
+st.title("性能診斷")
+
+# Only registered in st.navigation for admins, but guard against direct runs too.
+if not st.session_state.get('is_admin'):
+    st.error("只限管理員")
+    st.stop()
+
+
+def ms(seconds):
+    return round(seconds * 1000, 2)
+
+
+def show_timings():
+    st.subheader("計時 (毫秒)")
+    st.caption("頁面、資料庫函數及外部同步；百分位數按最近的樣本計算")
+    rows = [{'名稱': name, '次數': s['count'], 'p50': ms(s['p50']), 'p95': ms(s['p95']), 'p99': ms(s['p99']),
+             '最大': ms(s['max']), '平均': ms(s['mean']), '最近': ms(s['last'])}
+            for name, s in perf.summary().items()]
+    if not rows:
+        st.info("暫無計時數據")
+        return
+    groups = sorted({row['名稱'].split('.')[0] for row in rows})
+    group = st.selectbox("類別", ["全部", *groups])
+    df = pd.DataFrame(rows).sort_values('p95', ascending=False)
+    if group != "全部":
+        df = df[df['名稱'].str.split('.').str[0] == group]
+    st.dataframe(df, hide_index=True)
+
+
+def show_queries():
+    st.subheader("SQL 查詢 (毫秒)")
+    rows = [{'SQL': sql, '次數': s['count'], '平均行數': round(s['rows'] / s['count'], 1), 'p50': ms(s['p50']),
+             'p95': ms(s['p95']), 'p99': ms(s['p99']), '總計': ms(s['mean'] * s['count'])}
+            for sql, s in perf.query_summary().items()]
+    if rows:
+        st.dataframe(pd.DataFrame(rows).sort_values('總計', ascending=False), hide_index=True)
+    recent = perf.recent_queries()
+    if recent:
+        st.write("**最近查詢**")
+        st.dataframe(pd.DataFrame([{'時間': datetime.fromtimestamp(q['at']), '來源': q['caller'], 'SQL': q['sql'],
+                                    '行數': q['rows'], '毫秒': ms(q['duration'])} for q in reversed(recent)]),
+                     hide_index=True)
+    if st.button("檢查全表掃描"):
+        scans = db.find_full_scans()
+        if scans:
+            st.warning(scans)
+        else:
+            st.success("熱門查詢均使用索引")
+
+
+def show_cache_and_sync():
+    st.subheader("快取")
+    st.dataframe(pd.DataFrame([{'函數': name, **s} for name, s in function_cache.stats().items()]), hide_index=True)
+    st.subheader("縮圖快取")
+    thumbs = thumbnails.stats()
+    col1, col2, col3, col4 = st.columns(4)
+    col1.metric("命中率", f"{thumbs['hit_rate']:.0%}" if thumbs['hit_rate'] is not None else "-")
+    col2.metric("命中 / 未命中", f"{thumbs['hits']} / {thumbs['misses']}")
+    col3.metric("下載 (失敗)", f"{thumbs['downloads']} ({thumbs['download_failures']})")
+    col4.metric("容量", f"{thumbs['bytes'] / 2 ** 20:.1f} / {thumbs['max_bytes'] / 2 ** 20:.0f} MB")
+    st.caption(f"已清除 {thumbs['evictions']} 個檔案 ({thumbs['evicted_bytes'] / 2 ** 20:.1f} MB)")
+    st.subheader("外部同步")
+    st.json({'refresher': sync.get_refresher().status(), 'last_sync': sync.last_sync_stats()}, expanded=False)
+    if perf.TRACE_FILE:
+        st.caption(f"Span 記錄寫入: {perf.TRACE_FILE}")
+
+
+show_timings()
+show_queries()
+show_cache_and_sync()
+if st.button("重設統計"):
+    perf.reset()
+    st.rerun()
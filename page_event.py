@@ -5,18 +5,30 @@ import pandas as pd
 
 st.title("活動管理")
 
-# Event selection for editing
-events = db.get_events()
+PICKER_LIMIT = 20
+
+# Event selection for editing: search matches, or the latest events when the search is empty
+search_term = st.text_input("搜索活動", placeholder="輸入活動編號、名稱或日期").strip()
+if search_term:
+    events = db.search_events(search_term, limit=PICKER_LIMIT, columns=['id', 'name_tc', 'start_date'])
+else:
+    events = db.query_events(columns=['id', 'name_tc', 'start_date'], order_by='start_date',
+                             descending=True, limit=PICKER_LIMIT)
 event_options = {e['id']: f"{e['name_tc']} ({e['start_date']})" for e in events}
 selected_id = st.selectbox("選擇要編輯的活動", [None] + list(event_options.keys()),
                          format_func=lambda x: event_options.get(x, "新建活動"))
+if len(events) == PICKER_LIMIT:
+    st.caption(f"只顯示首 {PICKER_LIMIT} 個活動，請輸入搜索字眼收窄範圍")
 
 # Event form
 with st.expander("活動表單", expanded=True):
     with st.form("event_form"):
         # Load existing data if editing
         if selected_id:
-            existing = next(e for e in events if e['id'] == selected_id)
+            existing = db.get_event(selected_id)
+            # Remember the version first shown, so saving over someone else's edit is detected
+            if st.session_state.get('event_form_version', (None,))[0] != selected_id:
+                st.session_state.event_form_version = (selected_id, existing['version'])
         else:
             existing = None
             
@@ -40,7 +52,7 @@ with st.expander("活動表單", expanded=True):
 
         if selected_id:
             event_df = pd.DataFrame([existing])
-            edited_event = st.data_editor(event_df, num_rows="fixed")
+            edited_event = st.data_editor(event_df, num_rows="fixed", column_config={"version": None})
             new_event = edited_event.iloc[0].to_dict()
         else:
             new_event = {
@@ -62,5 +74,12 @@ with st.expander("活動表單", expanded=True):
         if st.form_submit_button("保存活動"):
             if selected_id:
                 new_event['id'] = selected_id
-            db.save_event(new_event)
-            st.rerun()
\ No newline at end of file
+                new_event['version'] = st.session_state.event_form_version[1]
+            try:
+                db.save_event(new_event)
+            except db.ConflictError:
+                st.error("活動已被其他人修改，未有保存。已重新載入最新資料，請再編輯")
+            else:
+                st.rerun()
+            finally:
+                st.session_state.pop('event_form_version', None)
\ No newline at end of file
@@ -1,109 +1,264 @@
-import time
+import math
 import streamlit as st
-import sqlite3
 import pandas as pd
 from datetime import datetime
 import function_db as db
-
-DB_NAME = "community_center.db"
+import function_perf as perf
+import function_thumbnails as thumbnails
 
 st.title("活動詳情")
 
-# Event selection with collapsible list and search functionality
-events = db.get_events()
-events.sort(key=lambda x: x['start_date'], reverse=True)  # Sort events by most recent
-
-# Create event_map dynamically to fix the NameError
-event_map = {event['id']: event for event in events}
-
-search_term = st.text_input("搜索活動", placeholder="輸入活動編號、名稱或日期").lower()
-# Optimized event search logic
-filtered_events = [
-    event for event in events 
-    if (search_term in str(event['external_id']).lower() or 
-        search_term in event['name_tc'].lower() or 
-        search_term in event['start_date'].lower())
-]
-
-with st.expander("所有活動",expanded='selected_event' in st.session_state):
-    for event in filtered_events:
-        event_label = f"{event['start_date']} - {event['external_id']} - {event['name_tc']}"
-        # Streamlined button handling with session state update
-        if st.button(f"📅 {event_label}", key=f"all_event_{event['id']}"):
-            st.session_state.selected_event = event['id']
-
-
-# Selected event details
-if st.session_state.selected_event:
-    event = event_map.get(st.session_state.selected_event)
-    if event:
-        # Improved DataFrame handling
-        df = pd.DataFrame({'lat': [event['location_lat']], 'lon': [event['location_lng']]})
-        valid_coordinates = not df.isnull().values.any()
-        st.divider()
-        st.subheader(event['name_tc'])
-        col1, col2 = st.columns(2)
-        with col1:
-            if event['thumbnail_url']:
-                st.image(event['thumbnail_url'], width=300)
-            st.write(f"**活動編號:** {event['external_id']}")
-            st.write(f"**開始日期:** {datetime.strptime(event['accurate_start_datetime'], '%Y-%m-%dT%H:%M:%SZ').strftime('%Y-%m-%d %H:%M')}")
-            st.write(f"**結束日期:** {datetime.strptime(event['accurate_end_datetime'], '%Y-%m-%dT%H:%M:%SZ').strftime('%Y-%m-%d %H:%M')}")
-            st.write(f"**主辦單位:** {event['organizer_tc']}")
-            st.write(f"**活動性質:** {event['activity_nature_tc']}")    
-            st.write(f"**名額:** {event['quota']}")
-            
-        with col2:
-            st.write(f"**地點:** {event['location_address_tc']}")
-            
-            if valid_coordinates: 
-                google_maps_location_url = f"https://www.google.com/maps?q={event['location_lat']},{event['location_lng']}"
-                st.markdown(f"[📍 在Google地圖中查看]({google_maps_location_url})", unsafe_allow_html=True)
-                google_maps_navigation_url = f"https://www.google.com/maps/dir/?api=1&origin=香港聖公會馬鞍山(南)青少年綜合服務中心+賽馬會青年幹線&destination={event['location_lat']},{event['location_lng']}"
-                st.markdown(f"[📍 在Google地圖中導航]({google_maps_navigation_url})", unsafe_allow_html=True)
-
-        # Only display the map if there are valid coordinates
+PAGE_SIZE = 20
+PICKER_LIMIT = 20
+
+
+def show_event_list():
+    # Event selection with collapsible list and search functionality
+    search_term = st.text_input("搜索活動", placeholder="輸入活動編號、名稱或日期").strip()
+    total_events = db.count_events(search=search_term)
+    page_count = max(1, math.ceil(total_events / PAGE_SIZE))
+
+    with st.expander("所有活動", expanded=True):
+        page = st.number_input("頁數", min_value=1, max_value=page_count, value=1, step=1, key=f"event_page_{search_term}")
+        # Most recent events first, one page at a time
+        events = db.query_events(columns=['id', 'start_date', 'external_id', 'name_tc'],
+                                 search=search_term, order_by='start_date', descending=True,
+                                 limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE)
+        # One virtualized table with row selection instead of one button per event
+        selection = st.dataframe(
+            pd.DataFrame(events, columns=['id', 'start_date', 'external_id', 'name_tc']),
+            column_config={
+                "id": None,
+                "start_date": "日期",
+                "external_id": "活動編號",
+                "name_tc": "活動名稱",
+            },
+            hide_index=True,
+            on_select="rerun",
+            selection_mode="single-row",
+            key=f"event_table_{search_term}_{page}",
+        )
+        if selection.selection.rows:
+            st.session_state.selected_event = events[selection.selection.rows[0]]['id']
+        st.caption(f"共 {total_events} 個活動，第 {page}/{page_count} 頁")
+
+
+def show_event_info(event):
+    # Improved DataFrame handling
+    df = pd.DataFrame({'lat': [event['location_lat']], 'lon': [event['location_lng']]})
+    valid_coordinates = not df.isnull().values.any()
+    st.divider()
+    st.subheader(event['name_tc'])
+    col1, col2 = st.columns(2)
+    with col1:
+        if event['thumbnail_url']:
+            thumbnail = thumbnails.get(event['thumbnail_url'])
+            if thumbnail:
+                st.image(thumbnail, width=300)
+            else:
+                st.caption("圖片暫時無法載入")
+        st.write(f"**活動編號:** {event['external_id']}")
+        st.write(f"**開始日期:** {datetime.strptime(event['accurate_start_datetime'], '%Y-%m-%dT%H:%M:%SZ').strftime('%Y-%m-%d %H:%M')}")
+        st.write(f"**結束日期:** {datetime.strptime(event['accurate_end_datetime'], '%Y-%m-%dT%H:%M:%SZ').strftime('%Y-%m-%d %H:%M')}")
+        st.write(f"**主辦單位:** {event['organizer_tc']}")
+        st.write(f"**活動性質:** {event['activity_nature_tc']}")
+        st.write(f"**名額:** {event['quota']}")
+        stats = db.get_event_stats(event['id'])
+        fill_rate = f" ({stats['fill_rate']:.0%})" if stats['fill_rate'] is not None else ""
+        st.write(f"**已註冊:** {stats['registered']}{fill_rate}　**已出席:** {stats['attended']}")
+
+    with col2:
+        st.write(f"**地點:** {event['location_address_tc']}")
+
         if valid_coordinates:
-            st.subheader("活動地點")
-            st.map(df, use_container_width=True)
+            google_maps_location_url = f"https://www.google.com/maps?q={event['location_lat']},{event['location_lng']}"
+            st.markdown(f"[📍 在Google地圖中查看]({google_maps_location_url})", unsafe_allow_html=True)
+            google_maps_navigation_url = f"https://www.google.com/maps/dir/?api=1&origin=香港聖公會馬鞍山(南)青少年綜合服務中心+賽馬會青年幹線&destination={event['location_lat']},{event['location_lng']}"
+            st.markdown(f"[📍 在Google地圖中導航]({google_maps_navigation_url})", unsafe_allow_html=True)
 
-        st.divider()
+    sessions = db.get_event_sessions(event['id'])
+    if len(sessions) > 1:
+        st.subheader("活動場次")
+        st.dataframe(pd.DataFrame(sessions, columns=['session_no', 'start_datetime', 'end_datetime']),
+                     column_config={"session_no": "場次", "start_datetime": "開始", "end_datetime": "結束"},
+                     hide_index=True)
+
+    # Only display the map if there are valid coordinates
+    if valid_coordinates:
+        st.subheader("活動地點")
+        st.map(df, use_container_width=True)
+
+
+def snapshot(name, key, load):
+    # What the user is editing, as first read. It is kept until saved so that
+    # only the user's own changes are written, not whatever changed meanwhile.
+    stored = st.session_state.get(name)
+    if stored is None or stored[0] != key:
+        stored = st.session_state[name] = (key, load())
+    return stored[1]
+
+
+def reload_snapshots():
+    st.session_state.pop('registration_snapshot', None)
+    st.session_state.pop('registration_changes', None)
+    st.session_state.pop('attendance_snapshot', None)
+
+
+def show_registered_students(event_id):
+    total = db.count_registered_students(event_id)
+    with st.expander(f"已註冊學生 ({total} 名)"):
+        page_count = max(1, math.ceil(total / PAGE_SIZE))
+        page = st.number_input("頁數", min_value=1, max_value=page_count, value=1, step=1,
+                               key=f"registered_page_{event_id}")
+        students = db.query_registered_students(event_id, columns=['name', 'english_name', 'school'],
+                                                limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE)
+        st.dataframe(pd.DataFrame(students, columns=['name', 'english_name', 'school']),
+                     column_config={"name": "姓名", "english_name": "英文名", "school": "學校"}, hide_index=True)
+
+
+@st.fragment
+def show_registration(event_id):
+    with perf.timed("活動詳情.註冊學生") as timing:
         st.subheader("學生管理")
-        
-        all_students = db.get_students()
-        current_reg_ids = db.get_current_registrations(event['id'])
-        
-        student_options = {s['id']: s['name'] for s in all_students}
+
+        original = snapshot('registration_snapshot', event_id, lambda: db.get_registration_versions(event_id))
+        # Unsaved changes as {student_id: register?}. They outlive the search box, which only
+        # decides which students are offered; the registered list itself is paged below.
+        changes = snapshot('registration_changes', event_id, dict)
+        show_registered_students(event_id)
+
+        search_term = st.text_input("搜索學生以新增或取消註冊", placeholder="輸入姓名、英文名或聯絡方式",
+                                    key="registration_search").strip()
+        found = db.search_students(search_term, limit=PICKER_LIMIT, columns=['id', 'name']) if search_term else []
+        student_options = {s['id']: s['name'] for s in found}
         selected_ids = st.multiselect(
             "註冊學生",
             options=list(student_options.keys()),
             format_func=lambda x: student_options[x],
-            default=current_reg_ids
+            default=[i for i in student_options if changes.get(i, i in original)],
+            key=f"registration_{event_id}_{search_term}"
         )
-        
-        if st.button("保存註冊名單"):
-            db.save_registration_changes(event['id'], selected_ids)
+        for student_id in student_options:
+            if (student_id in selected_ids) == (student_id in original):
+                changes.pop(student_id, None)
+            else:
+                changes[student_id] = student_id in selected_ids
+        if len(found) == PICKER_LIMIT:
+            st.caption(f"只顯示首 {PICKER_LIMIT} 個搜索結果，請輸入更多字眼收窄範圍")
+        if changes:
+            added = sum(changes.values())
+            st.caption(f"未保存的更改: 新增 {added} 名，取消註冊 {len(changes) - added} 名")
+
+        saved = st.session_state.pop('registration_saved', None)
+        if saved:
             st.success("註冊名單已更新")
-        
+        if saved and saved is not True and saved['conflicts']:
+            names = "、".join(saved['conflicts'])
+            st.warning(f"以下學生的記錄已被其他人修改，未有取消註冊: {names}")
+        col1, col2 = st.columns(2)
+        if col1.button("保存註冊名單"):
+            selected = (original.keys() - changes.keys()) | {i for i, register in changes.items() if register}
+            result = db.save_registration_changes(event_id, selected, original)
+            if result['conflicts']:
+                names = {s['id']: s['name'] for s in db.query_students(columns=['id', 'name'], student_ids=result['conflicts'])}
+                result['conflicts'] = [names.get(i, str(i)) for i in result['conflicts']]
+            reload_snapshots()
+            # The attendance editor lists registered students, so rerun the whole page
+            st.session_state.registration_saved = result
+            st.rerun()
+        if col2.button("重新載入", key="reload_registration"):
+            reload_snapshots()
+            st.rerun()
+
+        st.write("**按學校 / 地區批量註冊**")
+        col1, col2 = st.columns(2)
+        with col1:
+            school = st.selectbox("學校", [None, *db.get_student_schools()], format_func=lambda x: x or "所有學校")
+        with col2:
+            region = st.selectbox("地區", [None, *db.STUDENT_REGIONS], format_func=lambda x: x or "所有地區")
+        cohort = {'school': school, 'region': region}
+        if st.button(f"註冊 {db.count_students(**cohort)} 名符合條件的學生", disabled=not (school or region)):
+            db.register_cohort(event_id, **cohort)
+            reload_snapshots()
+            st.session_state.registration_saved = True
+            st.rerun()
+    perf.show_timing(timing)
+
+
+@st.fragment
+def show_attendance(event_id):
+    with perf.timed("活動詳情.出席記錄") as timing:
         st.subheader("出席記錄")
-        attendance = db.get_attendance_records(event['id'])
-        
+        sessions = db.get_event_sessions(event_id)
+        session = None
+        if len(sessions) > 1:
+            # Attendance can be taken for the whole event or for a single session
+            session = st.selectbox("場次", [None, *sessions],
+                                   format_func=lambda s: "整個活動" if s is None else f"第 {s['session_no']} 場 ({s['start_datetime']})")
+        if session:
+            attendance = snapshot('attendance_snapshot', (event_id, session['id']),
+                                  lambda: db.get_session_attendance_records(session['id']))
+        else:
+            attendance = snapshot('attendance_snapshot', (event_id, None), lambda: db.get_attendance_records(event_id))
+        editor_key = f"attendance_{event_id}_{session['id'] if session else 'all'}"
+
+        saved = st.session_state.pop('attendance_saved', None)
+        if saved:
+            st.success(f"出席記錄已更新 ({saved['written']} 筆)")
+            if saved['conflicts']:
+                names = "、".join(saved['conflicts'])
+                st.warning(f"以下學生的出席記錄已被其他人修改，未有保存，請檢查後再試: {names}")
+
         if not attendance.empty:
             edited_attendance = st.data_editor(
                 attendance,
                 column_config={
                     "student_id": None,
                     "name": st.column_config.TextColumn("學生姓名", disabled=True),
-                    "attended": st.column_config.CheckboxColumn("出席")
+                    "attended": st.column_config.CheckboxColumn("出席"),
+                    "version": None
                 },
                 hide_index=True,
-                key=f"attendance_{event['id']}"
+                key=editor_key
             )
-            
-            # Simplified attendance record update logic
-            if st.button("保存出席記錄"):
-                db.update_attendance_records(edited_attendance, event['id'])
-                st.success("出席記錄已更新")
+
+            col1, col2 = st.columns(2)
+            if col1.button("保存出席記錄"):
+                if session:
+                    result = db.update_session_attendance_records(edited_attendance, session['id'], attendance)
+                else:
+                    result = db.update_attendance_records(edited_attendance, event_id, attendance)
+                names = attendance.set_index('student_id')['name']
+                result['conflicts'] = [names.get(i, str(i)) for i in result['conflicts']]
+                st.session_state.attendance_saved = result
+                # Show the saved rows, and anyone else's changes, from a fresh read
+                st.session_state.pop('attendance_snapshot', None)
+                st.session_state.pop(editor_key, None)
+                st.rerun()
+            if col2.button("重新載入", key="reload_attendance"):
+                st.session_state.pop('attendance_snapshot', None)
+                st.session_state.pop(editor_key, None)
+                st.rerun()
 
         else:
-            st.info("暫無註冊學生")
\ No newline at end of file
+            st.info("暫無註冊學生")
+    perf.show_timing(timing)
+
+
+# The list and the detail panel rerun together when an event is selected; the
+# registration and attendance panels below rerun on their own.
+@st.fragment
+def show_event_browser():
+    with perf.timed("活動詳情.活動列表及詳情") as timing:
+        show_event_list()
+        event = db.get_event(st.session_state.selected_event) if st.session_state.selected_event else None
+        if event:
+            show_event_info(event)
+    perf.show_timing(timing)
+    if event:
+        st.divider()
+        show_registration(event['id'])
+        show_attendance(event['id'])
+
+
+show_event_browser()
@@ -0,0 +1,111 @@
+from datetime import date, timedelta
+import streamlit as st
+import pandas as pd
+import function_db as db
+import function_geo as geo
+import function_perf as perf
+
+st.title("活動地圖")
+
+MAX_MAP_EVENTS = 2000
+# (min_lat, min_lng, max_lat, max_lng)
+MAP_AREAS = {
+    "全港": (22.15, 113.82, 22.57, 114.45),
+    "沙田 / 馬鞍山 / 大埔": (22.36, 114.15, 22.48, 114.28),
+    "九龍": (22.28, 114.13, 22.35, 114.24),
+    "港島": (22.19, 114.11, 22.29, 114.26),
+    "新界西": (22.35, 113.90, 22.52, 114.13),
+    "大嶼山 / 東涌": (22.20, 113.83, 22.32, 114.05),
+}
+CENTRE_AREA = "中心附近"
+
+
+def choose_filters():
+    col1, col2 = st.columns(2)
+    with col1:
+        area = st.selectbox("範圍", [CENTRE_AREA, *MAP_AREAS])
+        if area == CENTRE_AREA:
+            radius = st.slider("半徑 (公里)", min_value=1, max_value=30, value=5)
+            bbox = db.bbox_around(*db.CENTRE_LOCATION, radius)
+        else:
+            bbox = MAP_AREAS[area]
+    with col2:
+        dates = st.date_input("日期", value=(date.today(), date.today() + timedelta(days=90)))
+    filters = {'bbox': bbox}
+    if len(dates) == 2:
+        filters['start_date_from'], filters['start_date_to'] = dates
+    return filters
+
+
+# Only the events inside the chosen area and dates are loaded.
+@st.fragment
+def show_map():
+    with perf.timed("活動地圖.地圖") as timing:
+        filters = choose_filters()
+        total = db.count_events(**filters)
+        events = db.query_events(columns=['id', 'name_tc', 'start_date', 'location_address_tc',
+                                          'location_lat', 'location_lng'],
+                                 limit=MAX_MAP_EVENTS, **filters)
+        df = pd.DataFrame(events, columns=['id', 'name_tc', 'start_date', 'location_address_tc',
+                                           'location_lat', 'location_lng'])
+        st.map(df.rename(columns={'location_lat': 'lat', 'location_lng': 'lon'}), width='stretch')
+        if total > MAX_MAP_EVENTS:
+            st.warning(f"範圍內有 {total} 個活動，只顯示最早的 {MAX_MAP_EVENTS} 個，請縮小範圍或日期")
+        else:
+            st.caption(f"範圍內共 {total} 個活動")
+        selection = st.dataframe(
+            df,
+            column_config={
+                "id": None,
+                "name_tc": "活動名稱",
+                "start_date": "開始日期",
+                "location_address_tc": "地點",
+                "location_lat": None,
+                "location_lng": None,
+            },
+            hide_index=True,
+            on_select="rerun",
+            selection_mode="single-row",
+        )
+        if selection.selection.rows:
+            st.session_state.selected_event = events[selection.selection.rows[0]]['id']
+            st.info("已選擇活動，可在「活動詳情」查看")
+    perf.show_timing(timing)
+
+
+@st.fragment
+def show_nearest():
+    st.subheader("最近的活動")
+    col1, col2 = st.columns(2)
+    with col1:
+        origin = st.radio("由", ["中心", "學生地址"], horizontal=True)
+    with col2:
+        k = st.number_input("數量", min_value=1, max_value=50, value=10, step=1)
+    upcoming_only = st.checkbox("只顯示未來活動", value=True)
+    filters = {'start_date_from': date.today()} if upcoming_only else {}
+    with perf.timed("活動地圖.最近活動") as timing:
+        if origin == "中心":
+            nearest = db.nearest_events(*db.CENTRE_LOCATION, k=k, **filters)
+        else:
+            search_term = st.text_input("搜索學生", placeholder="輸入姓名、英文名或聯絡方式").strip()
+            students = db.search_students(search_term, columns=['id', 'name', 'address']) if search_term else []
+            student = st.selectbox("學生", students, format_func=lambda s: f"{s['name']} ({s['address'] or '沒有地址'})")
+            if not student:
+                return
+            try:
+                nearest = geo.nearest_events_to_student(student['id'], k=k, **filters)
+            except Exception as e:
+                st.error(f"地址定位失敗: {e}")
+                return
+            if nearest is None:
+                st.warning("無法定位此學生的地址")
+                return
+        df = pd.DataFrame(nearest, columns=['name_tc', 'start_date', 'distance_km'])
+        st.dataframe(df, column_config={"name_tc": "活動名稱", "start_date": "開始日期",
+                                        "distance_km": st.column_config.NumberColumn("距離 (公里)", format="%.1f")},
+                     hide_index=True)
+    perf.show_timing(timing)
+
+
+show_map()
+show_nearest()
@@ -1,14 +1,11 @@
 import streamlit as st
-import sqlite3
-import pandas as pd
-import requests
 from datetime import datetime
 import function_db as db
 
 # Display upcoming events
 st.subheader("即將到來的活動")
-all_events = db.get_events()
-upcoming_events = [event for event in all_events if event['start_date'] >= str(datetime.now().date())][:5]
+upcoming_events = db.query_events(columns=['name_tc', 'start_date', 'location_address_tc'],
+                                  start_date_from=datetime.now().date(), limit=5)
 if upcoming_events:
     for event in upcoming_events:
         st.markdown(f"""
@@ -19,13 +16,29 @@ if upcoming_events:
 else:
     st.info("暫無即將到來的活動")
 
+# Sessions in the next 7 days, including later sessions of multi-session events
+st.subheader("未來7日場次")
+upcoming_sessions = db.get_upcoming_sessions(days=7, limit=10)
+if upcoming_sessions:
+    for session in upcoming_sessions:
+        st.markdown(f"- **{session['name_tc']}** 第 {session['session_no']} 場  \n"
+                    f"  時間: {session['start_datetime'][:16].replace('T', ' ')}")
+else:
+    st.info("未來7日暫無場次")
+
 # Optional: Display some statistics
 st.subheader("統計數據")
-all_students = db.get_students()
-total_students = len(all_students)
-total_events = len(all_events)
+overview = db.get_overview_stats()
+col1, col2, col3, col4 = st.columns(4)
+col1.metric("總學生數", overview['students'])
+col2.metric("總活動數", overview['events'])
+col3.metric("總註冊人次", overview['registrations'])
+col4.metric("出席率", f"{overview['attendance_rate']:.0%}" if overview['attendance_rate'] is not None else "-")
 
-st.markdown(f"""
-- 總學生數: {total_students}
-- 總活動數: {total_events}
-""")
\ No newline at end of file
+monthly = db.get_monthly_stats()
+if monthly:
+    st.caption("每月註冊及出席人次")
+    st.bar_chart({'月份': [m['month'] for m in monthly],
+                  '註冊': [m['registered'] for m in monthly],
+                  '出席': [m['attended'] for m in monthly]},
+                 x='月份', y=['註冊', '出席'], stack=False)
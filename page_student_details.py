@@ -1,38 +1,50 @@
+import math
 import streamlit as st
-import sqlite3
 import pandas as pd
 import function_db as db
-
-DB_NAME = "community_center.db"
+import function_perf as perf
 
 st.title("學生詳情")
 
-# All students list
-st.subheader("選擇學生")
-students = db.get_students()
-cols = st.columns(3)
-for idx, student in enumerate(students):
-    with cols[idx % 3]:
-        if st.button(f"👤 {student['name']}", key=f"all_student_{student['id']}"):
-            st.session_state.selected_student = student['id']
-
-# Selected student details
-if st.session_state.selected_student:
-    conn = sqlite3.connect(DB_NAME)
-    conn.row_factory = sqlite3.Row  # Add this line
-    student = conn.execute('SELECT * FROM students WHERE id = ?', 
-                        (st.session_state.selected_student,)).fetchone()
-    attendance = conn.execute('''SELECT events.name_tc, events.start_date, attendance.attended
-                            FROM attendance
-                            JOIN events ON attendance.event_id = events.id
-                            WHERE student_id = ?''', 
-                            (st.session_state.selected_student,)).fetchall()
-    conn.close()
+PAGE_SIZE = 30
+
+
+def show_student_list():
+    # All students list
+    st.subheader("選擇學生")
+    search_term = st.text_input("搜索學生", placeholder="輸入姓名、英文名或聯絡方式").strip()
+    total_students = db.count_students(search=search_term)
+    page_count = max(1, math.ceil(total_students / PAGE_SIZE))
+    page = st.number_input("頁數", min_value=1, max_value=page_count, value=1, step=1, key=f"student_page_{search_term}")
+    students = db.query_students(columns=['id', 'name', 'english_name', 'school'], search=search_term,
+                                 order_by='name', limit=PAGE_SIZE, offset=(page - 1) * PAGE_SIZE)
+    # One virtualized table with row selection instead of one button per student
+    selection = st.dataframe(
+        pd.DataFrame(students, columns=['id', 'name', 'english_name', 'school']),
+        column_config={
+            "id": None,
+            "name": "姓名",
+            "english_name": "英文名",
+            "school": "學校",
+        },
+        hide_index=True,
+        on_select="rerun",
+        selection_mode="single-row",
+        key=f"student_table_{search_term}_{page}",
+    )
+    if selection.selection.rows:
+        st.session_state.selected_student = students[selection.selection.rows[0]]['id']
+    st.caption(f"共 {total_students} 名學生，第 {page}/{page_count} 頁")
+
+
+def show_student(student_id):
+    student = db.get_student(student_id)
+    attendance = db.get_student_attendance(student_id)
     df = pd.DataFrame(attendance, columns=['活動名稱', '日期', '出席'])
- 
+
     st.divider()
     st.subheader("學生詳細資料")
-    
+
     st.write(f"**姓名:** {student['name']}")
     st.write(f"**聯絡方式:** {student['contact']}")
     st.write(f"**地址:** {student['address']}")  # 新增字段：地址
@@ -42,11 +54,26 @@ if st.session_state.selected_student:
     st.write(f"**備註:** {student['remarks']}")  # 新增字段：备注
     st.write(f"**註冊時間:** {student['registered_at']}")
 
-    if attendance:
-        st.write(f"Registed Event: {len(df.index)} Attended Event: {(df['出席'] == 1).sum()} ")
+    stats = db.get_student_stats(student_id)
+    if stats['registered']:
+        st.write(f"Registed Event: {stats['registered']} Attended Event: {stats['attended']} ")
     st.subheader("出席記錄")
     if attendance:
         df['出席'] = df['出席'].map({1: '✅', 0: '❌'})
         st.dataframe(df, hide_index=True)
     else:
-        st.info("暫無出席記錄")
\ No newline at end of file
+        st.info("暫無出席記錄")
+
+
+# Selecting a student only reruns the list and the detail panel.
+@st.fragment
+def show_student_browser():
+    with perf.timed("學生詳情.學生列表及詳情") as timing:
+        show_student_list()
+        # Selected student details
+        if st.session_state.selected_student:
+            show_student(st.session_state.selected_student)
+    perf.show_timing(timing)
+
+
+show_student_browser()
@@ -1,20 +1,29 @@
 import streamlit as st
 import function_db as db
+import function_import as importer
 
 st.title("學生管理")
 
-# Student selection for editing
-students = db.get_students()
+PICKER_LIMIT = 20
+
+# Student selection for editing: search matches, or the newest students when the search is empty
+search_term = st.text_input("搜索學生", placeholder="輸入姓名、英文名或聯絡方式").strip()
+if search_term:
+    students = db.search_students(search_term, limit=PICKER_LIMIT, columns=['id', 'name'])
+else:
+    students = db.query_students(columns=['id', 'name'], order_by='id', descending=True, limit=PICKER_LIMIT)
 student_options = {s['id']: s['name'] for s in students}
 selected_id = st.selectbox("選擇要編輯的學生", [None] + list(student_options.keys()),
                          format_func=lambda x: student_options.get(x, "新建學生"))
+if len(students) == PICKER_LIMIT:
+    st.caption(f"只顯示首 {PICKER_LIMIT} 名學生，請輸入搜索字眼收窄範圍")
 
 # Student form
 with st.expander("學生表單", expanded=True):
     with st.form("student_form"):
         # Load existing data if editing
         if selected_id:
-            existing = next(s for s in students if s['id'] == selected_id)
+            existing = db.get_student(selected_id)
         else:
             existing = None
             
@@ -22,7 +31,7 @@ with st.expander("學生表單", expanded=True):
         contact = st.text_input("聯絡方式 (電話)", value=existing['contact'] if existing else "")
         address = st.text_input("地址", value=existing['address'] if existing else "")  # 新增字段：地址
         english_name = st.text_input("英文名", value=existing['english_name'] if existing else "")  # 新增字段：英文名
-        region = st.selectbox("地區", ["Tung Chung", "Hong Kong Island"], index=["Tung Chung", "Hong Kong Island"].index(existing['region']) if existing and existing['region'] else 0)  # 新增字段：地区
+        region = st.selectbox("地區", db.STUDENT_REGIONS, index=db.STUDENT_REGIONS.index(existing['region']) if existing and existing['region'] else 0)  # 新增字段：地区
         school = st.text_input("學校", value=existing['school'] if existing else "")  # 新增字段：学校
         remarks = st.text_area("備註", value=existing['remarks'] if existing else "")  # 新增字段：备注
         
@@ -40,3 +49,26 @@ with st.expander("學生表單", expanded=True):
                 student['id'] = selected_id
             db.save_student(student)
             st.rerun()
+
+# Bulk import from a CSV or Excel file
+with st.expander("批量匯入學生"):
+    st.caption("欄位: 姓名, 聯絡方式, 地址, 英文名, 地區, 學校, 備註 (只有姓名為必填)")
+    uploaded = st.file_uploader("上載 CSV 或 Excel 檔案", type=importer.IMPORT_FORMATS)
+    if uploaded is not None:
+        try:
+            rows = importer.read_students(uploaded, uploaded.name)
+            valid, errors = importer.validate_students(rows)
+        except ValueError as e:
+            st.error(str(e))
+        else:
+            st.write(f"共 {len(rows)} 行，{len(valid)} 行可匯入，{len(errors)} 行有錯誤")
+            if len(errors):
+                st.dataframe(errors, hide_index=True)
+                st.download_button("下載錯誤列表", errors.to_csv(index=False).encode('utf-8-sig'),
+                                   file_name="import_errors.csv", mime="text/csv")
+            if len(valid) and st.button(f"匯入 {len(valid)} 名學生"):
+                result = importer.import_students(rows)
+                st.session_state.import_result = f"已匯入 {result['inserted']} 名學生 ({result['elapsed']:.1f}s)"
+                st.rerun()
+    if 'import_result' in st.session_state:
+        st.success(st.session_state.pop('import_result'))
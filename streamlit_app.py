@@ -1,11 +1,13 @@
+import hmac
+import os
+import time
 import streamlit as st
-import sqlite3
-import pandas as pd
-import requests
-from datetime import datetime
-import function_db as db
+import function_bootstrap
+import function_export as export
+import function_perf as perf
+import function_sync as sync
 
-DB_NAME = "community_center.db"
+started = time.perf_counter()
 
 # Session state setup
 if 'selected_student' not in st.session_state:
@@ -15,28 +17,83 @@ if 'selected_event' not in st.session_state:
 
 
 
-# Initialize database and fetch external events
-db.init_db()
-db.fetch_and_save_external_events()
+# Initialize database and start the external event sync, once per process
+@st.cache_resource
+def bootstrap():
+    return function_bootstrap.bootstrap()
+
+
+startup = bootstrap()
+refresher = sync.get_refresher()
 
 # Data management in sidebar
 st.sidebar.header("數據管理")
 if st.sidebar.button("刷新外部活動數據"):
-    db.fetch_and_save_external_events()
-    st.sidebar.success("活動數據已更新")
+    with st.sidebar:
+        with st.spinner("正在刷新外部活動數據..."):
+            refresher.trigger(wait_timeout=refresher.timeout)
+
+refresh_status = refresher.status()
+if refresh_status['last_error']:
+    st.sidebar.error(f"外部活動刷新失敗 ({refresh_status['last_error_at']:%Y-%m-%d %H:%M}): {refresh_status['last_error']}")
+if refresh_status['last_success_at']:
+    stats = refresh_status['last_stats'] or {}
+    duration = f"{refresh_status['last_duration']:.1f}s" if refresh_status['last_duration'] is not None else "-"
+    st.sidebar.caption(f"上次成功刷新: {refresh_status['last_success_at']:%Y-%m-%d %H:%M:%S} "
+                       f"({duration}; 新增 {stats.get('inserted', 0)}, "
+                       f"更新 {stats.get('updated', 0)}, 未變 {stats.get('skipped', 0)})")
+elif refresh_status['running']:
+    st.sidebar.caption("正在刷新外部活動數據...")
+
+with st.sidebar.expander("導出數據"):
+    export_format = st.selectbox("格式", list(export.FORMATS), format_func=str.upper)
+    export_filters = {}
+    if st.checkbox("按日期篩選"):
+        export_filters['start_date_from'] = st.date_input("由", key="export_from")
+        export_filters['start_date_to'] = st.date_input("至", key="export_to")
+    export_event_id = st.number_input("活動 ID (0 = 所有活動)", min_value=0, value=0, step=1)
+    if export_event_id:
+        export_filters['event_id'] = int(export_event_id)
 
-if st.sidebar.button("導出所有數據"):
-    with pd.ExcelWriter('community_data.xlsx') as writer:
-        pd.read_sql("SELECT * FROM events", sqlite3.connect(DB_NAME)).to_excel(writer, sheet_name='Events', index=False)
-        pd.read_sql("SELECT * FROM students", sqlite3.connect(DB_NAME)).to_excel(writer, sheet_name='Students', index=False)
-        pd.read_sql("SELECT * FROM attendance", sqlite3.connect(DB_NAME)).to_excel(writer, sheet_name='Attendance', index=False)
-    st.sidebar.success("數據導出成功")
+    # The export only runs when the button is clicked, on a separate thread.
+    export_stats = st.session_state.setdefault('export_stats', {})
+    st.download_button("導出所有數據",
+                       data=lambda: export.export_bytes(export_format, stats=export_stats, **export_filters),
+                       file_name=export.FORMATS[export_format][0],
+                       mime=export.FORMATS[export_format][1],
+                       on_click='ignore')
+    if export_stats:
+        st.caption(f"上次導出: {export_stats['rows']} 行, {export_stats['elapsed']:.1f}s "
+                   f"({export_stats['rows_per_sec']:.0f} 行/秒)")
 
-pg = st.navigation([
+st.sidebar.checkbox("顯示渲染時間", key="show_timings")
+
+# The diagnostics page is only offered once the ADMIN_PASSWORD has been entered.
+admin_password = os.environ.get('ADMIN_PASSWORD')
+if admin_password and not st.session_state.get('is_admin'):
+    entered = st.sidebar.text_input("管理員密碼", type="password")
+    if entered:
+        st.session_state.is_admin = hmac.compare_digest(entered.encode(), admin_password.encode())
+        if not st.session_state.is_admin:
+            st.sidebar.error("密碼錯誤")
+
+pages = [
     st.Page("page_home.py", title="首頁"),
     st.Page("page_event.py", title="活動"),
     st.Page("page_students.py", title="學生"),
     st.Page("page_event_details.py", title="活動詳情"),
-    st.Page("page_student_details.py", title="學生詳情")
-])
-pg.run()
\ No newline at end of file
+    st.Page("page_student_details.py", title="學生詳情"),
+    st.Page("page_event_map.py", title="活動地圖"),
+]
+if st.session_state.get('is_admin'):
+    pages.append(st.Page("page_diagnostics.py", title="性能診斷"))
+pg = st.navigation(pages)
+with perf.timed(f"頁面.{pg.title}") as page_timing:
+    pg.run()
+with st.sidebar:
+    perf.show_timing(page_timing)
+
+perf.record("應用.重新執行", time.perf_counter() - started)
+if st.session_state.get('show_timings'):
+    st.sidebar.caption(f"⏱ 冷啟動: {startup['cold_start'] * 1000:.1f} ms ({startup['started_at']:%Y-%m-%d %H:%M:%S})")
+    st.sidebar.caption(f"⏱ 本次重新執行: {perf.last('應用.重新執行') * 1000:.1f} ms")
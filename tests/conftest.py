@@ -0,0 +1,15 @@
+import pytest
+
+import function_db as db
+
+
+@pytest.fixture
+def database(tmp_path, monkeypatch):
+    """A fresh, migrated SQLite database in a temp directory."""
+    monkeypatch.setattr(db, 'DB_NAME', str(tmp_path / 'test.db'))
+    db.use_database(None)
+    db.invalidate()
+    db.init_db()
+    yield db
+    db.close_connections()
+    db.invalidate()
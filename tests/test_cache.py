@@ -0,0 +1,31 @@
+import copy
+import pickle
+
+import pytest
+
+from function_cache import FrozenRecord, cached, invalidate
+
+
+@cached('test_cache')
+def read_rows():
+    return [{'id': 1, 'tags': ['a']}]
+
+
+def test_hits_share_one_immutable_value():
+    invalidate('test_cache')
+    rows = read_rows()
+    assert rows is read_rows()
+    assert rows == ({'id': 1, 'tags': ('a',)},)
+    with pytest.raises(TypeError):
+        rows[0]['id'] = 2
+    with pytest.raises(TypeError):
+        rows[0].update(id=2)
+
+
+def test_copies_are_editable():
+    record = read_rows()[0]
+    edited = dict(record)
+    edited['id'] = 2
+    assert record['id'] == 1
+    assert copy.deepcopy(record) == record
+    assert isinstance(pickle.loads(pickle.dumps(record)), FrozenRecord)
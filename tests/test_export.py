@@ -0,0 +1,43 @@
+import io
+import zipfile
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+import function_export as export
+from benchmarks.data import generate_database
+
+
+@pytest.fixture
+def populated(database):
+    generate_database(events=20, students=30, attendance=100)
+    return database
+
+
+@pytest.mark.parametrize('fmt', list(export.FORMATS))
+def test_export_bytes(populated, fmt):
+    stats = {}
+    data = export.export_bytes(fmt, stats=stats)
+    assert isinstance(data, bytes)
+    assert stats['tables'] == {'events': 20, 'students': 30, 'attendance': 100}
+
+
+def test_parquet_booleans(populated, monkeypatch):
+    # Server databases return real bools for BOOLEAN columns.
+    monkeypatch.setattr(export, '_iter_tables', lambda conn, queries, counts: iter(
+        [('attendance', ['event_id', 'student_id', 'attended'], iter([[(1, 1, True), (1, 2, False), (1, 3, None)]]))]))
+    out = io.BytesIO()
+    export.export_data('parquet', out)
+    with zipfile.ZipFile(out) as archive:
+        table = pq.read_table(io.BytesIO(archive.read('attendance.parquet')))
+    assert table.schema.field('attended').type == pa.bool_()
+    assert table.column('attended').to_pylist() == [True, False, None]
+
+
+def test_parquet_sqlite_booleans(populated):
+    out = io.BytesIO()
+    export.export_data('parquet', out)
+    with zipfile.ZipFile(out) as archive:
+        table = pq.read_table(io.BytesIO(archive.read('attendance.parquet')))
+    assert set(table.column('attended').to_pylist()) <= {True, False}
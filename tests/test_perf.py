@@ -0,0 +1,24 @@
+import json
+
+import function_perf as perf
+
+
+def test_iterated_statement_is_recorded_once_with_its_row_count(database):
+    with database.get_connection() as conn:
+        conn.executemany('''INSERT INTO students (name) VALUES (?)''', [(f"學生{i}",) for i in range(50)])
+    perf.reset()
+    with database.get_connection() as conn:
+        names = [row[0] for row in conn.execute('''SELECT name FROM students ORDER BY id''')]
+    assert len(names) == 50
+    recorded = [q for q in perf.recent_queries() if q['sql'].startswith('SELECT name FROM students')]
+    assert [q['rows'] for q in recorded] == [50]
+
+
+def test_spans_are_appended_to_the_trace_file(tmp_path, monkeypatch):
+    monkeypatch.setattr(perf, 'TRACE_FILE', str(tmp_path / 'trace.jsonl'))
+    for name in ('a', 'b'):
+        with perf.timed(f"測試.{name}"):
+            pass
+    # Written line by line, so the spans are readable while the handle stays open.
+    lines = (tmp_path / 'trace.jsonl').read_text(encoding='utf-8').splitlines()
+    assert [json.loads(line)['name'] for line in lines] == ["測試.a", "測試.b"]
@@ -0,0 +1,33 @@
+import pytest
+
+import function_db as db
+from benchmarks.data import generate_database
+
+
+@pytest.fixture
+def populated(database):
+    generate_database(events=200, students=300, attendance=2000)
+    with db.get_connection() as conn:
+        conn.execute('ANALYZE')
+    return database
+
+
+@pytest.mark.parametrize('name', sorted(db.HOT_QUERIES))
+def test_hot_query_uses_an_index(populated, name):
+    assert db.find_full_scans({name: db.HOT_QUERIES[name]}) == {}
+
+
+def test_no_full_scans(populated):
+    assert db.find_full_scans() == {}
+
+
+def test_overview_counts_follow_inserts_and_deletes(populated):
+    assert {k: v for k, v in db.get_overview_stats().items() if k in ('students', 'events')} == \
+        {'students': 300, 'events': 200}
+    with db.get_connection() as conn:
+        conn.execute('''DELETE FROM students WHERE id IN (SELECT id FROM students LIMIT 5)''')
+        conn.execute('''INSERT INTO events (name_tc) VALUES ('新活動')''')
+        counts = conn.execute('''SELECT (SELECT COUNT(*) FROM students), (SELECT COUNT(*) FROM events)''').fetchone()
+    db.invalidate()
+    overview = db.get_overview_stats()
+    assert (overview['students'], overview['events']) == tuple(counts) == (295, 201)
@@ -0,0 +1,20 @@
+import pytest
+
+
+@pytest.fixture
+def students(database):
+    with database.get_connection() as conn:
+        conn.executemany('''INSERT INTO students (name, contact, address, school, registered_at)
+                            VALUES (?,?,?,?,?)''',
+                         [('陳大文', '91234567', '馬鞍山', '沙田官立中學', '2026-01-01'),
+                          ('李小明', '98765432', '東涌', '東涌天主教學校', '2026-01-01')])
+    database.invalidate()
+    return database
+
+
+@pytest.mark.parametrize('term', ['沙田', '沙田官立', '東涌', '東涌天主'])
+def test_short_and_long_terms_search_the_same_columns(students, term):
+    # Two characters go through LIKE, four through the trigram index.
+    found = [s['name'] for s in students.query_students(columns=['name'], search=term)]
+    assert found == [s['name'] for s in students.search_students(term, columns=['name'])]
+    assert found and students.count_students(search=term) == len(found)
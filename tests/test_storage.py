@@ -0,0 +1,105 @@
+import io
+import random
+import zipfile
+
+import pytest
+import sqlalchemy as sa
+
+import function_db as db
+import function_export as export
+import function_sync as sync
+from benchmarks.data import make_activity
+from benchmarks.stub_api import StubActivityAPI
+
+
+@pytest.fixture
+def server(database):
+    """The repository functions served by SQLAlchemy from an in-memory SQLite database."""
+    db.use_database('sqlite://')
+    db.init_db()
+    yield db
+    db.use_database(None)
+
+
+@pytest.fixture
+def event_id(server):
+    server.save_event(sync.event_to_row(make_activity(random.Random(1), 1)))
+    return server.query_events(columns=['id'])[0]['id']
+
+
+@pytest.fixture
+def student_ids(server):
+    server.insert_students([(f"學生{i}", f"9000000{i}", "", "", "Tung Chung", "沙田官立中學", "") for i in range(5)])
+    return [s['id'] for s in server.query_students(columns=['id'])]
+
+
+def test_sync_upserts_by_external_id(server):
+    with StubActivityAPI({'SKHWC': 150}, etags=False) as api:
+        first = sync.sync_external_events(force=True, base_url=api.base_url, target_groups=['SKHWC'],
+                                           hits=100, timeout=5)
+        api.feeds['SKHWC'][120]['name_tc'] = "已更改"
+        second = sync.sync_external_events(force=True, base_url=api.base_url, target_groups=['SKHWC'],
+                                           hits=100, timeout=5)
+    assert first['inserted'] == 150
+    assert (second['inserted'], second['updated'], second['skipped']) == (0, 1, 149)
+    changed = server.query_events(columns=['name_tc', 'version'], search="已更改")
+    assert [(e['name_tc'], e['version']) for e in changed] == [("已更改", 1)]
+    assert server.count_events() == 150
+
+
+def test_stale_event_version_conflicts(server, event_id):
+    event = dict(server.get_event(event_id))
+    server.save_event({**event, 'name_en': "first"})
+    with pytest.raises(db.ConflictError):
+        server.save_event({**event, 'name_en': "second"})
+    assert server.get_event(event_id)['name_en'] == "first"
+    assert server.get_event(event_id)['version'] == event['version'] + 1
+
+
+def test_stale_attendance_version_conflicts(server, event_id, student_ids):
+    server.save_registration_changes(event_id, student_ids)
+    original = server.get_attendance_records(event_id)
+    edited = original.copy()
+    edited['attended'] = True
+    assert server.update_attendance_records(edited, event_id, original) == {'written': 5, 'conflicts': []}
+    # Saving the same edit over the rows as first read: each one changed meanwhile.
+    result = server.update_attendance_records(edited, event_id, original)
+    assert result['written'] == 0
+    assert sorted(result['conflicts']) == sorted(student_ids)
+
+
+def test_registration_changes_apply_only_the_delta(server, event_id, student_ids):
+    first, second, third, fourth, fifth = student_ids
+    server.save_registration_changes(event_id, [first, second, third])
+    snapshot = server.get_registration_versions(event_id)
+    # Meanwhile someone registers a fourth student and edits the second one's row.
+    server.save_registration_changes(event_id, [first, second, third, fourth], snapshot)
+    records = server.get_attendance_records(event_id)
+    edited = records.copy()
+    edited.loc[edited['student_id'] == second, 'attended'] = True
+    server.update_attendance_records(edited, event_id, records)
+
+    result = server.save_registration_changes(event_id, [first, fifth], snapshot)
+    assert (result['added'], result['removed'], result['conflicts']) == (1, 1, [second])
+    assert sorted(server.get_current_registrations(event_id)) == sorted([first, second, fourth, fifth])
+
+
+@pytest.mark.parametrize('fmt', list(export.FORMATS))
+def test_export(server, event_id, student_ids, fmt):
+    server.save_registration_changes(event_id, student_ids)
+    stats = {}
+    data = export.export_bytes(fmt, stats=stats)
+    assert isinstance(data, bytes) and data
+    assert stats['tables'] == {'events': 1, 'students': 5, 'attendance': 5}
+    if fmt == 'csv':
+        assert len(zipfile.ZipFile(io.BytesIO(data)).namelist()) == 3
+
+
+def test_failed_statement_does_not_leak_its_start_time(server):
+    engine = server._repository.engine
+    with engine.connect() as conn:
+        with pytest.raises(sa.exc.OperationalError):
+            conn.exec_driver_sql("SELECT * FROM no_such_table")
+        assert conn.info.get('query_started') == []
+        assert conn.exec_driver_sql("SELECT 1").scalar() == 1
+        assert conn.info['query_started'] == []
@@ -0,0 +1,149 @@
+import random
+import time
+
+import pytest
+
+import function_db as db
+import function_sync as sync
+from benchmarks.data import make_activity
+from benchmarks.stub_api import StubActivityAPI
+
+
+@pytest.fixture(autouse=True)
+def no_backoff(monkeypatch):
+    monkeypatch.setattr(sync, 'RETRY_BACKOFF_SECONDS', 0)
+
+
+def run_sync(api, target_groups=('SKHWC',), **kwargs):
+    return sync.sync_external_events(force=True, base_url=api.base_url, target_groups=list(target_groups),
+                                     **{'hits': 100, 'timeout': 5, **kwargs})
+
+
+@pytest.mark.parametrize('include_total', [True, False])
+def test_paginated_feed(database, include_total):
+    with StubActivityAPI({'SKHWC': 250}, include_total=include_total) as api:
+        stats = run_sync(api)
+    assert stats['fetched'] == stats['inserted'] == 250
+    assert stats['requests'] == 3
+    assert db.count_events() == 250
+
+
+def test_paging_without_total_stops_after_short_page(database):
+    # 200 activities in pages of 100: the empty third page ends the feed.
+    with StubActivityAPI({'SKHWC': 200}, include_total=False) as api:
+        stats = run_sync(api)
+    assert stats['requests'] == 3
+    assert stats['inserted'] == 200
+
+
+def test_unchanged_feed_is_not_modified(database):
+    with StubActivityAPI({'SKHWC': 150}) as api:
+        run_sync(api)
+        stats = run_sync(api)
+    assert stats['not_modified']
+    # Both pages are asked again, and both answer 304.
+    assert stats['requests'] == 2
+    assert (stats['inserted'], stats['updated']) == (0, 0)
+
+
+@pytest.mark.parametrize('include_total', [True, False])
+def test_change_behind_an_unchanged_first_page_is_synced(database, include_total):
+    with StubActivityAPI({'SKHWC': 250}, include_total=include_total) as api:
+        run_sync(api)
+        # The stub's page 1 ETag stays the same; only page 2 changes.
+        api.feeds['SKHWC'][120]['name_tc'] = "已更改"
+        stats = run_sync(api)
+    assert stats['requests'] == 3
+    assert (stats['fetched'], stats['inserted'], stats['updated'], stats['skipped']) == (100, 0, 1, 99)
+    assert db.count_events(search="已更改") == 1
+
+
+def test_new_page_behind_unchanged_pages_is_synced(database):
+    # Without a total, a feed that grows past a full last page gains a page.
+    with StubActivityAPI({'SKHWC': 200}, include_total=False) as api:
+        run_sync(api)
+        api.feeds['SKHWC'].append(api.feeds['SKHWC'][0] | {'activityCode': 'NEW000001', 'name_tc': "新活動"})
+        stats = run_sync(api)
+    assert stats['inserted'] == 1
+    assert db.count_events(search="新活動") == 1
+
+
+def test_changed_activity_is_updated(database):
+    with StubActivityAPI({'SKHWC': 150}, etags=False) as api:
+        run_sync(api)
+        api.feeds['SKHWC'][120]['name_tc'] = "已更改"
+        stats = run_sync(api)
+    assert (stats['inserted'], stats['updated'], stats['skipped']) == (0, 1, 149)
+    assert db.count_events(search="已更改") == 1
+
+
+def test_failed_requests_are_retried(database):
+    with StubActivityAPI({'SKHWC': 50}, fail_requests=2) as api:
+        stats = run_sync(api, max_retries=3)
+    assert stats['inserted'] == 50
+    assert stats['requests'] == 3
+
+
+def test_gives_up_after_max_retries(database):
+    with StubActivityAPI({'SKHWC': 50}, fail_requests=10) as api, pytest.raises(Exception):
+        run_sync(api, max_retries=2)
+    assert db.count_events() == 0
+
+
+def test_client_errors_are_not_retried(database):
+    with StubActivityAPI({'SKHWC': 50}, fail_requests=1, fail_status=404) as api, pytest.raises(Exception):
+        run_sync(api, max_retries=3)
+    assert api.requests == 1
+
+
+def test_slow_pages_are_fetched_concurrently(database):
+    with StubActivityAPI({'SKHWC': 800}, delay=0.2) as api:
+        stats = run_sync(api, max_concurrency=4)
+    assert stats['inserted'] == 800
+    assert 1 < api.peak_in_flight <= 4
+
+
+def test_response_slower_than_timeout_fails(database):
+    with StubActivityAPI({'SKHWC': 10}, delay=0.5) as api, pytest.raises(Exception):
+        run_sync(api, timeout=0.1, max_retries=1)
+
+
+def test_duplicates_across_feeds_take_the_last_copy(database):
+    rng = random.Random(1)
+    shared = [make_activity(rng, i) for i in range(50)]
+    with StubActivityAPI({'SKHWC': 0, 'EXTRA': 0}, etags=False) as api:
+        api.feeds['SKHWC'] = shared
+        api.feeds['EXTRA'] = [{**a, 'name_tc': f"EXTRA {a['name_tc']}"} for a in shared]
+        first = run_sync(api, target_groups=('SKHWC', 'EXTRA'))
+        versions = {e['id']: e['version'] for e in db.query_events(columns=['id', 'version'])}
+        second = run_sync(api, target_groups=('SKHWC', 'EXTRA'))
+    assert first['inserted'] == 50
+    assert (second['inserted'], second['updated'], second['skipped']) == (0, 0, 50)
+    events = db.query_events(columns=['id', 'name_tc', 'version'])
+    assert all(e['name_tc'].startswith("EXTRA ") for e in events)
+    assert {e['id']: e['version'] for e in events} == versions
+
+
+def test_stub_feeds_are_distinct(database):
+    with StubActivityAPI({'SKHWC': 100, 'EXTRA': 25}) as api:
+        stats = run_sync(api, target_groups=('SKHWC', 'EXTRA'))
+    assert stats['fetched'] == stats['inserted'] == 125
+
+
+def test_refresher_status_is_complete_once_a_run_succeeds(database):
+    with StubActivityAPI({'SKHWC': 20}, delay=0.05) as api:
+        refresher = sync.ExternalEventRefresher(interval=60, timeout=5, base_url=api.base_url)
+        refresher.start()
+        try:
+            # Poll while the first run is in flight; no snapshot may be half written.
+            deadline = time.monotonic() + 10
+            while time.monotonic() < deadline:
+                status = refresher.status()
+                if status['last_success_at'] is not None:
+                    assert status['last_duration'] is not None
+                    assert status['last_stats']['inserted'] == 20
+                    break
+                time.sleep(0.001)
+        finally:
+            refresher.stop()
+    assert status['last_success_at'] is not None